@@ -0,0 +1,113 @@
+"""sqlite storage of assets shared by several worker processes"""
+import os
+import sqlite3
+import threading
+
+SQLITE_MAX_VARIABLES = 500
+
+CREATE_TABLES_SQL = """
+CREATE TABLE IF NOT EXISTS assets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    char_code TEXT NOT NULL,
+    name TEXT NOT NULL UNIQUE,
+    capital REAL NOT NULL,
+    interest REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS generation (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0);
+"""
+
+
+class SqliteAssetStorage:
+    """Durable log of assets
+
+    Rows are only appended, so a reader that has seen rows up to some id
+    catches up by reading the tail after it. Cleanup removes all rows and
+    bumps the generation, which tells readers to reload from scratch.
+    """
+    def __init__(self, filepath: str):
+        """Init storage, connection is opened lazily in every process"""
+        self.filepath = filepath
+        self._lock = threading.Lock()
+        self._connection = None
+        self._connection_pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Connection of current process, forked workers open their own"""
+        if self._connection is None or self._connection_pid != os.getpid():
+            connection = sqlite3.connect(
+                self.filepath, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(CREATE_TABLES_SQL)
+            self._connection = connection
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def data_version(self) -> int:
+        """Changes whenever another connection commits"""
+        with self._lock:
+            return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def add_many(self, rows) -> list:
+        """Insert (char_code, name, capital, interest) rows in one transaction
+
+        Rows with names which are already stored are skipped, names of
+        inserted rows are returned.
+        """
+        rows = list(rows)
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                taken = set()
+                names = [row[1] for row in rows]
+                for start in range(0, len(names), SQLITE_MAX_VARIABLES):
+                    chunk = names[start:start + SQLITE_MAX_VARIABLES]
+                    taken.update(name for name, in connection.execute(
+                        "SELECT name FROM assets WHERE name IN (%s)"
+                        % ",".join("?" * len(chunk)), chunk))
+                new_rows = [row for row in rows if row[1] not in taken]
+                connection.executemany(
+                    "INSERT INTO assets (char_code, name, capital, interest) "
+                    "VALUES (?, ?, ?, ?)", new_rows)
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return [row[1] for row in new_rows]
+
+    def clear(self):
+        """Remove all assets"""
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute("DELETE FROM assets")
+            connection.execute("UPDATE generation SET value = value + 1")
+            connection.execute("COMMIT")
+
+    def changes(self, generation, last_id: int):
+        """Rows added after last_id, or all rows if generation has changed
+
+        Returns current generation, id of the last row and rows as
+        (char_code, name, capital, interest) tuples.
+        """
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN")
+            try:
+                current_generation, = connection.execute(
+                    "SELECT value FROM generation").fetchone()
+                if current_generation != generation:
+                    last_id = 0
+                rows = connection.execute(
+                    "SELECT id, char_code, name, capital, interest FROM assets "
+                    "WHERE id > ? ORDER BY id", (last_id,)).fetchall()
+            finally:
+                connection.execute("COMMIT")
+        if rows:
+            last_id = rows[-1][0]
+        return current_generation, last_id, [row[1:] for row in rows]
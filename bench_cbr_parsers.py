@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""micro-benchmark of cbr parsers on saved cbr pages"""
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+import json
+import timeit
+
+import task_Torshin_Dmitrii_asset_web_service as task
+
+DEFAULT_DAILY_PAGE_PATH = "cbr_currency_base_daily.html"
+DEFAULT_KEY_INDICATORS_PAGE_PATH = "cbr_key_indicators.html"
+DEFAULT_REPEAT = 200
+
+
+def soup_parse_cbr_currency_base_daily(document):
+    """reference BeautifulSoup parser the service used before"""
+    from bs4 import BeautifulSoup
+    currency_dict = {}
+    soup = BeautifulSoup(document, 'html.parser')
+    table = soup.find('tbody')
+    for index, line in enumerate(table.find_all('tr')):
+        if index > 0:
+            items = line.find_all('td')
+            currency_dict[items[1].get_text()] = round(float(items[4].get_text()) / \
+                int(items[2].get_text()), 8)
+    return currency_dict
+
+
+def soup_parse_cbr_key_indicators(document):
+    """reference BeautifulSoup parser the service used before"""
+    from bs4 import BeautifulSoup
+    indicators_dict = {}
+    soup = BeautifulSoup(document, 'html.parser')
+    currencies = soup.find("div", {"class": "key-indicator_content offset-md-2"})
+    currencies_table = currencies.find('tbody')
+    for index, line in enumerate(currencies_table.find_all('tr')):
+        if index > 0:
+            currency = line.find("div", \
+                {"class": "col-md-3 offset-md-1 _subinfo"}).get_text()
+            value = line.find_all("td")[2].get_text()
+            indicators_dict[currency] = float(value)
+
+    metals = soup.find_all("div", {"class": "key-indicator_content offset-md-2"})[1]
+    metals_table = metals.find('tbody')
+    for index, line in enumerate(metals_table.find_all('tr')):
+        if index > 0:
+            metal = line.find("div", \
+                {"class": "col-md-3 offset-md-1 _subinfo"}).get_text()
+            value = line.find_all("td")[1].get_text()
+            indicators_dict[metal] = float(value.replace(",", ""))
+
+    return indicators_dict
+
+
+def measure(parser, document, repeat):
+    """mean time of single parser call in milliseconds"""
+    return timeit.timeit(lambda: parser(document), number=repeat) / repeat * 1000
+
+
+def run_benchmark(daily_path, key_indicators_path, repeat):
+    """compare lxml parsers with BeautifulSoup ones on the same pages"""
+    cases = [
+        ("daily", daily_path, task.parse_cbr_currency_base_daily,
+            soup_parse_cbr_currency_base_daily),
+        ("key_indicators", key_indicators_path, task.parse_cbr_key_indicators,
+            soup_parse_cbr_key_indicators),
+    ]
+    report = {}
+    for name, path, parser, reference in cases:
+        with open(path) as fin:
+            document = fin.read()
+        result = {"lxml_ms": round(measure(parser, document, repeat), 4)}
+        try:
+            assert reference(document) == parser(document), f"{name} output differs"
+            result["bs4_ms"] = round(measure(reference, document, repeat), 4)
+            result["speedup"] = round(result["bs4_ms"] / result["lxml_ms"], 2)
+        except ImportError:
+            result["bs4_ms"] = None
+        report[name] = result
+    return report
+
+
+def main():
+    parser = ArgumentParser(
+        prog="bench-cbr-parsers",
+        description="compare cbr page parsers speed",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--daily", default=DEFAULT_DAILY_PAGE_PATH,
+                        help="saved cbr daily currencies page")
+    parser.add_argument("--key-indicators", default=DEFAULT_KEY_INDICATORS_PAGE_PATH,
+                        help="saved cbr key indicators page")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="number of parser calls to average")
+    arguments = parser.parse_args()
+    report = run_benchmark(arguments.daily, arguments.key_indicators, arguments.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""startup time of command line tools measured with python -X importtime"""
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CLI_MODULES = [
+    "task_Torshin_Dmitrii_stackoverflow_analytics",
+    "task_Torshin_Dmitrii_inverted_index",
+]
+HEAVY_MODULES = ["yaml", "lxml", "numpy", "flask", "requests"]
+DEFAULT_REPEAT = 5
+DEFAULT_TOP = 5
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(output):
+    """(module, self us, cumulative us) for every line of -X importtime output"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def import_module_timed(module):
+    """import module in fresh interpreter, returns parsed importtime output"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(completed.stderr)
+
+
+def imported_heavy_modules(imports):
+    """heavy modules which were imported"""
+    names = {name for name, _, _ in imports}
+    return [module for module in HEAVY_MODULES if module in names]
+
+
+def measure_help(module):
+    """wall time in milliseconds of running tool with --help"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, f"{module}.py", "--help"], cwd=REPO_DIR,
+                   stdout=subprocess.DEVNULL, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def run_benchmark(modules, repeat, top):
+    """median import and --help times of every module and its slowest imports"""
+    report = {}
+    for module in modules:
+        runs = [import_module_timed(module) for _ in range(repeat)]
+        cumulative_ms = [
+            next(cumulative for name, _, cumulative in imports if name == module) / 1000
+            for imports in runs
+        ]
+        slowest = sorted(runs[-1], key=lambda item: item[1], reverse=True)[:top]
+        report[module] = {
+            "import_ms": round(statistics.median(cumulative_ms), 3),
+            "help_ms": round(statistics.median(measure_help(module) for _ in range(repeat)), 3),
+            "heavy_modules": imported_heavy_modules(runs[-1]),
+            "slowest_imports_ms": {name: round(self_us / 1000, 3) for name, self_us, _ in slowest},
+        }
+    return report
+
+
+def main():
+    parser = ArgumentParser(
+        prog="bench-startup",
+        description="measure startup time of command line tools",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("modules", nargs="*", default=CLI_MODULES,
+                        help="tool modules to import")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="number of fresh interpreters to take median of")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP,
+                        help="number of slowest imports to show")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with error if heavy modules are imported on startup")
+    arguments = parser.parse_args()
+    report = run_benchmark(arguments.modules, arguments.repeat, arguments.top)
+    print(json.dumps(report, indent=2))
+    if arguments.check and any(result["heavy_modules"] for result in report.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
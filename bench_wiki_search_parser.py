@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""micro-benchmark of wikipedia search page parser on saved pages"""
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+import json
+import timeit
+
+from lxml import etree
+
+from wiki_search_app import parse_wiki_search_output
+
+DEFAULT_PAGE_PATHS = ["wikipedia_python_network.html"]
+DEFAULT_REPEAT = 200
+
+
+def tree_parse_wiki_search_output(wiki_search_output):
+    """reference parser which builds the whole tree and evaluates xpath strings"""
+    root = etree.fromstring(wiki_search_output, etree.HTMLParser())
+    document_collection = []
+    for document in root.xpath("//li[@class='mw-search-result']"):
+        title = document.xpath(".//a[1]/@title")[0]
+        link = document.xpath(".//a[1]/@href")[0]
+        snippet = "".join(document.xpath(".//div[@class='searchresult']")[0].itertext())
+        document_collection.append([title, link, snippet])
+    return document_collection
+
+
+def measure(parser, document, repeat):
+    """mean time of single parser call in milliseconds"""
+    return timeit.timeit(lambda: parser(document), number=repeat) / repeat * 1000
+
+
+def run_benchmark(page_paths, repeat):
+    """compare current parser with the reference one on every page"""
+    report = {}
+    for path in page_paths:
+        with open(path) as fin:
+            document = fin.read()
+        assert tree_parse_wiki_search_output(document) == parse_wiki_search_output(document), \
+            f"{path} output differs"
+        reference_ms = measure(tree_parse_wiki_search_output, document, repeat)
+        current_ms = measure(parse_wiki_search_output, document, repeat)
+        report[path] = {
+            "reference_ms": round(reference_ms, 4),
+            "current_ms": round(current_ms, 4),
+            "speedup": round(reference_ms / current_ms, 2),
+        }
+    return report
+
+
+def main():
+    parser = ArgumentParser(
+        prog="bench-wiki-search-parser",
+        description="compare wikipedia search page parsers speed",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("pages", nargs="*", default=DEFAULT_PAGE_PATHS,
+                        help="saved wikipedia search result pages")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="number of parser calls to average")
+    arguments = parser.parse_args()
+    print(json.dumps(run_benchmark(arguments.pages, arguments.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""approximate word scores with bounded memory"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import heapq
+import math
+import zlib
+
+# ranges whose ranked top words are kept, each holds at most capacity words
+DEFAULT_RANGE_CACHE_SIZE = 64
+
+
+def rank(estimates) -> list:
+    """(word, score) pairs with positive score by score, ties in alphabetical order"""
+    return sorted(((word, score) for word, score in estimates if score > 0),
+                  key=lambda item: (-item[1], item[0]))
+
+
+class CountMinSketch:
+    """Approximate counters of words in depth rows of width cells
+
+    For non negative counts estimate exceeds the true count by at most
+    epsilon * total count with probability 1 - delta. Sketches of the same
+    shape are merged by adding cells.
+    """
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+
+    @classmethod
+    def from_error(cls, epsilon: float, delta: float):
+        """smallest sketch with given error bounds"""
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def _cells(self, word: str):
+        data = word.encode('utf-8')
+        return [zlib.crc32(data, seed) % self.width for seed in range(self.depth)]
+
+    def add(self, word: str, count: int = 1):
+        for row, cell in zip(self.rows, self._cells(word)):
+            row[cell] += count
+
+    def estimate(self, word: str) -> int:
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(word)))
+
+    def merge(self, other):
+        """sketch of both streams"""
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("can not merge sketches of different shape")
+        merged = CountMinSketch(self.width, self.depth)
+        merged.rows = [array('q', map(int.__add__, first, second))
+                       for first, second in zip(self.rows, other.rows)]
+        return merged
+
+
+class HeavyHitters:
+    """Top words by score kept next to count-min sketch of all scores
+
+    At most capacity candidate words are tracked, a new word replaces the
+    candidate with the lowest estimate once its own estimate is larger.
+    """
+    def __init__(self, capacity: int, sketch: CountMinSketch):
+        self.capacity = capacity
+        self.sketch = sketch
+        self.candidates = {}
+        self._heap = []
+
+    @classmethod
+    def from_error(cls, capacity: int, epsilon: float, delta: float):
+        return cls(capacity, CountMinSketch.from_error(epsilon, delta))
+
+    def add(self, word: str, score: int):
+        self.sketch.add(word, score)
+        estimate = self.sketch.estimate(word)
+        if word not in self.candidates and len(self.candidates) >= self.capacity:
+            lowest_word, lowest_estimate = self._lowest()
+            if estimate <= lowest_estimate:
+                return
+            del self.candidates[lowest_word]
+        self.candidates[word] = estimate
+        heapq.heappush(self._heap, (estimate, word))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(value, key) for key, value in self.candidates.items()]
+            heapq.heapify(self._heap)
+
+    def _lowest(self):
+        """candidate with lowest estimate, outdated heap entries are dropped"""
+        while True:
+            estimate, word = self._heap[0]
+            if self.candidates.get(word) == estimate:
+                return word, estimate
+            heapq.heappop(self._heap)
+
+    def merge(self, other):
+        """heavy hitters of both streams, for example of two years or workers"""
+        merged = HeavyHitters(max(self.capacity, other.capacity),
+                              self.sketch.merge(other.sketch))
+        words = self.candidates.keys() | other.candidates.keys()
+        estimates = {word: merged.sketch.estimate(word) for word in words}
+        merged.candidates = dict(heapq.nlargest(
+            merged.capacity, estimates.items(), key=lambda item: item[1]))
+        merged._heap = [(value, key) for key, value in merged.candidates.items()]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def top(self, top_n: int) -> list:
+        """top_n (word, score) pairs by score, ties in alphabetical order
+
+        Words with score not above zero are left out like in Counter sums.
+        """
+        estimates = ((word, self.sketch.estimate(word)) for word in self.candidates)
+        return rank(estimates)[:top_n]
+
+
+class RangeHeavyHitters:
+    """Heavy hitters of any range of consecutive keys such as years
+
+    Count-Min sketch is linear, so sketch of a range is the difference of
+    two prefix sums of sketches. Estimates are read from the two prefix
+    sketches without building a sketch per query. Top capacity words of
+    cache_size recently queried ranges are kept.
+
+    Memory grows by one prefix sketch per key: width * depth * 8 bytes,
+    about 1.1 MB per year with epsilon 0.0001 and delta 0.01, plus
+    capacity candidate words per key.
+    """
+    def __init__(self, heavy_hitters_by_key: dict, cache_size: int = DEFAULT_RANGE_CACHE_SIZE):
+        self.keys = sorted(heavy_hitters_by_key)
+        self.capacity = max((heavy_hitters.capacity
+                             for heavy_hitters in heavy_hitters_by_key.values()), default=0)
+        self.cache_size = cache_size
+        self._candidates = [heavy_hitters_by_key[key].candidates for key in self.keys]
+        self._prefix_sketches = []
+        for key in self.keys:
+            sketch = heavy_hitters_by_key[key].sketch
+            if self._prefix_sketches:
+                sketch = self._prefix_sketches[-1].merge(sketch)
+            self._prefix_sketches.append(sketch)
+        self._ranked = OrderedDict()
+
+    def _estimate(self, word: str, first: int, last: int) -> int:
+        upper = self._prefix_sketches[last - 1]
+        cells = upper._cells(word)
+        if first == 0:
+            return min(row[cell] for row, cell in zip(upper.rows, cells))
+        lower = self._prefix_sketches[first - 1]
+        return min(upper_row[cell] - lower_row[cell]
+                   for upper_row, lower_row, cell in zip(upper.rows, lower.rows, cells))
+
+    def top(self, start, end, top_n: int) -> list:
+        """top_n (word, score) pairs of keys from start to end inclusive
+
+        At most capacity pairs are returned.
+        """
+        first = bisect_left(self.keys, start)
+        last = bisect_right(self.keys, end)
+        if first >= last:
+            return []
+        ranked = self._ranked.get((first, last))
+        if ranked is None:
+            words = set().union(*self._candidates[first:last])
+            ranked = rank((word, self._estimate(word, first, last)) for word in words)
+            ranked = ranked[:self.capacity]
+            self._ranked[first, last] = ranked
+            while len(self._ranked) > self.cache_size:
+                self._ranked.popitem(last=False)
+        else:
+            self._ranked.move_to_end((first, last))
+        return ranked[:top_n]
@@ -1,8 +1,11 @@
 from flask import Flask, redirect, url_for, abort, render_template
 from markupsafe import escape
 
+from metrics import instrument_app
+
 
 app = Flask(__name__)
+metrics = instrument_app(app)
 
 MAX_GREETING_COUNT = 100
 REALLY_TOO_MANY_GREETING_COUNT = 1000
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""load test of flask services against local fake upstreams"""
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from werkzeug.serving import make_server
+
+DEFAULT_WORKERS = 2
+DEFAULT_CONCURRENCY = 16
+DEFAULT_DURATION = 5.0
+DEFAULT_UPSTREAM_LATENCY = 0.05
+DEFAULT_ASSET_COUNT = 1000
+SERVER_START_TIMEOUT = 10.0
+
+CURRENCY_CODES = ["AUD", "GBP", "USD", "EUR", "CNY", "JPY", "KRW", "CHF"]
+METALS = {"Au": "4,529.59", "Ag": "58.94", "Pt": "2,443.66", "Pd": "5,800.12"}
+
+
+def make_cbr_daily_page():
+    """page shaped like cbr daily currency rates"""
+    rows = "".join(
+        f"<tr><td>{index:03d}</td><td>{code}</td><td>1</td><td>{code}</td>"
+        f"<td>{50 + index}.1234</td></tr>"
+        for index, code in enumerate(CURRENCY_CODES)
+    )
+    return ("<html><body><table class='data'><tbody><tr><th>Num code</th><th>Char code</th>"
+            f"<th>Unit</th><th>Currency</th><th>Rate</th></tr>{rows}</tbody></table></body></html>")
+
+
+def make_cbr_key_indicators_page():
+    """page shaped like cbr key indicators"""
+    def table(rows):
+        return ("<div class='key-indicator_content offset-md-2'><table><tbody>"
+                f"<tr><th></th><th></th><th></th></tr>{rows}</tbody></table></div>")
+    currencies = "".join(
+        f"<tr><td><div class='col-md-3 offset-md-1 _subinfo'>{code}</div></td>"
+        f"<td>1.0</td><td>{70 + index}.5</td></tr>"
+        for index, code in enumerate(["USD", "EUR"])
+    )
+    metals = "".join(
+        f"<tr><td><div class='col-md-3 offset-md-1 _subinfo'>{metal}</div></td>"
+        f"<td>{price}</td><td>1.0</td></tr>"
+        for metal, price in METALS.items()
+    )
+    return f"<html><body>{table(currencies)}{table(metals)}</body></html>"
+
+
+def make_wiki_search_page(query):
+    """page shaped like wikipedia search results"""
+    results = "".join(
+        f"<li class='mw-search-result'><div><a href='/wiki/{query}_{index}' "
+        f"title='{query} {index}'>{query}</a></div>"
+        f"<div class='searchresult'>{query} result number {index}</div></li>"
+        for index in range(20)
+    )
+    return (f"<html><head><title>{query}</title></head><body>"
+            f"<ul class='mw-search-results'>{results}</ul>"
+            + "<p>footer</p>" * 200 + "</body></html>")
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    """serves cbr and wikipedia lookalike pages after a delay"""
+    latency = DEFAULT_UPSTREAM_LATENCY
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlsplit(self.path)
+        if url.path.startswith("/cbr/daily"):
+            body = make_cbr_daily_page()
+        elif url.path.startswith("/cbr/key-indicators"):
+            body = make_cbr_key_indicators_page()
+        elif url.path.startswith("/w/index.php"):
+            body = make_wiki_search_page(url.query.partition("search=")[2] or "empty")
+        else:
+            body = "not found"
+        body = body.encode("utf-8")
+        self.send_response(404 if body == b"not found" else 200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_upstream(latency):
+    """run fake upstream in background thread, returns server and its base url"""
+    handler = type("LatencyHandler", (FakeUpstreamHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+@contextmanager
+def override(module, **attributes):
+    """set module attributes for the duration of the block"""
+    originals = {name: getattr(module, name) for name in attributes}
+    for name, value in attributes.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(module, name, value)
+
+
+@contextmanager
+def prepare_hello_world(upstream_url, asset_count):
+    """hello world app and paths to request"""
+    import hello_world
+    yield hello_world.app, ["/", "/hello/user/", "/hello/user/10"]
+
+
+@contextmanager
+def prepare_wiki_search(upstream_url, asset_count):
+    """wiki search app pointed to fake wikipedia and paths to request"""
+    import wiki_search_app
+    queries = [f"query{index}" for index in range(50)]
+    paths = [f"/api/search?query={query}" for query in queries]
+    paths += [f"/search?query={query}" for query in queries]
+    with override(wiki_search_app,
+                  WIKI_BASE_SEARCH_URL=f"{upstream_url}/w/index.php?search="):
+        yield wiki_search_app.app, paths
+
+
+@contextmanager
+def prepare_asset_service(upstream_url, asset_count):
+    """asset service with bank shared by workers through sqlite pointed to fake cbr"""
+    import task_Torshin_Dmitrii_asset_web_service as asset_service
+    from asset_storage import SqliteAssetStorage
+    paths = [
+        "/api/asset/list",
+        "/api/asset/get?name=asset1&name=asset2&name=asset3",
+        "/api/asset/calculate_revenue?period=1&period=5&period=10",
+    ]
+    codes = CURRENCY_CODES + list(METALS)
+    with tempfile.TemporaryDirectory(prefix="load_test_") as storage_dir:
+        bank = asset_service.CompositeAsset(
+            storage=SqliteAssetStorage(os.path.join(storage_dir, "assets.sqlite")))
+        bank.add_many(
+            asset_service.Asset(codes[index % len(codes)], f"asset{index}", 1000.0 + index, 0.05)
+            for index in range(asset_count)
+        )
+        with override(asset_service,
+                      DAILY_CURRENCY_LINK=f"{upstream_url}/cbr/daily/",
+                      KEY_INDICATORS_LINK=f"{upstream_url}/cbr/key-indicators/"), \
+                override(asset_service.app, bank=bank):
+            yield asset_service.app, paths
+
+
+APPS = {
+    "hello_world": prepare_hello_world,
+    "wiki_search": prepare_wiki_search,
+    "asset_service": prepare_asset_service,
+}
+
+
+def serve_forever(app, listening_socket):
+    """worker process, accepts connections from socket shared by all workers"""
+    # access log of every request would only measure stderr speed
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True, fd=listening_socket.fileno())
+    server.serve_forever()
+
+
+def start_workers(app, workers):
+    """fork workers serving app on one port, returns processes and base url"""
+    listening_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listening_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listening_socket.bind(("127.0.0.1", 0))
+    listening_socket.listen(1024)
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=serve_forever, args=(app, listening_socket), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    base_url = f"http://127.0.0.1:{listening_socket.getsockname()[1]}"
+    listening_socket.close()
+    return processes, base_url
+
+
+def wait_until_ready(base_url, path, timeout=SERVER_START_TIMEOUT):
+    """poll path until workers accept connections"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            requests.get(base_url + path, timeout=timeout)
+            return
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def percentile(sorted_values, fraction):
+    """nearest rank percentile of sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def generate_load(base_url, paths, concurrency, duration):
+    """request paths in round robin from concurrent clients for duration seconds
+
+    Returns latencies in seconds and counts of responses by status code.
+    """
+    deadline = time.monotonic() + duration
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def client(client_index):
+        session = requests.Session()
+        local_latencies = []
+        local_statuses = {}
+        request_index = client_index
+        while time.monotonic() < deadline:
+            url = base_url + paths[request_index % len(paths)]
+            request_index += concurrency
+            start = time.perf_counter()
+            try:
+                status = session.get(url).status_code
+            except requests.RequestException:
+                status = "error"
+            local_latencies.append(time.perf_counter() - start)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(client, range(concurrency)))
+    return latencies, statuses
+
+
+def run_load_test(app_name, workers=DEFAULT_WORKERS, concurrency=DEFAULT_CONCURRENCY,
+                  duration=DEFAULT_DURATION, upstream_latency=DEFAULT_UPSTREAM_LATENCY,
+                  asset_count=DEFAULT_ASSET_COUNT):
+    """run app under workers against fake upstreams, returns report as dict"""
+    upstream, upstream_url = start_fake_upstream(upstream_latency)
+    try:
+        with APPS[app_name](upstream_url, asset_count) as (app, paths):
+            processes, base_url = start_workers(app, workers)
+            try:
+                wait_until_ready(base_url, paths[0])
+                started = time.perf_counter()
+                latencies, statuses = generate_load(base_url, paths, concurrency, duration)
+                elapsed = time.perf_counter() - started
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.join()
+    finally:
+        upstream.shutdown()
+        upstream.server_close()
+
+    latencies.sort()
+    return {
+        "app": app_name,
+        "workers": workers,
+        "concurrency": concurrency,
+        "upstream_latency_ms": upstream_latency * 1000,
+        "duration_s": round(elapsed, 3),
+        "requests": len(latencies),
+        "statuses": {str(status): count for status, count in sorted(
+            statuses.items(), key=lambda item: str(item[0]))},
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 3) if latencies else None
+            for name, fraction in [("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)]
+        },
+    }
+
+
+def main():
+    parser = ArgumentParser(
+        prog="load-test",
+        description="load test flask services against local fake upstreams",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--app", dest="apps", action="append", choices=list(APPS),
+                        help="app to load, may be repeated, all apps by default")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of server processes")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="number of concurrent clients")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+                        help="seconds to run load for each app")
+    parser.add_argument("--upstream-latency", type=float, default=DEFAULT_UPSTREAM_LATENCY,
+                        help="seconds fake upstreams wait before reply")
+    parser.add_argument("--assets", type=int, default=DEFAULT_ASSET_COUNT,
+                        help="number of assets loaded into asset service")
+    arguments = parser.parse_args()
+    reports = [
+        run_load_test(app_name, arguments.workers, arguments.concurrency, arguments.duration,
+                      arguments.upstream_latency, arguments.assets)
+        for app_name in arguments.apps or APPS
+    ]
+    print(json.dumps(reports, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""request latency metrics for flask apps in prometheus text format
+
+Metrics live in memory of the process which served the request, so with
+several worker processes /metrics shows only the worker which answered
+the scrape. Set METRICS_SHARED_DIR (or pass shared_dir) to a directory
+shared by the workers: every worker then writes its metrics there and
+/metrics reports the sum over all workers. Other workers are seen with
+a delay of up to DEFAULT_FLUSH_INTERVAL seconds.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+
+from flask import Response, g, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = "<unmatched>"
+METRICS_SHARED_DIR_ENV = "METRICS_SHARED_DIR"
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+_shared_metrics = weakref.WeakSet()
+
+
+def format_labels(labels) -> str:
+    """render (name, value) pairs as prometheus labels"""
+    if not labels:
+        return ""
+    escaped = (
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+                     .replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """Counts of observed values in cumulative buckets, split by labels"""
+    def __init__(self, name: str, documentation: str, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value: float, *label_values):
+        """add single value for given label values"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def snapshot(self) -> list:
+        """[label values, bucket counts, sum] of every series"""
+        with self._lock:
+            return [[list(labels), list(counts), total]
+                    for labels, (counts, total) in self._series.items()]
+
+    def add_snapshot(self, snapshot):
+        """add series of snapshot of histogram with the same buckets"""
+        with self._lock:
+            for label_values, counts, total in snapshot:
+                series = self._series.setdefault(
+                    tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0])
+                series[0] = [first + second for first, second in zip(series[0], counts)]
+                series[1] += total
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def collect(self):
+        """lines of prometheus text format"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total)
+                      for labels, (counts, total) in sorted(self._series.items())]
+        for label_values, counts, total in series:
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = format_labels(labels + [("le", "+Inf" if bound == float("inf")
+                                                                 else repr(bound))])
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{format_labels(labels)} {total!r}"
+            yield f"{self.name}_count{format_labels(labels)} {cumulative}"
+
+
+class Gauge:
+    """Value which goes up and down"""
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount):
+        with self._lock:
+            self.value += amount
+
+    def collect(self):
+        """lines of prometheus text format"""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {self.value}"
+
+
+class Metrics:
+    """Metrics of single flask app, summed over processes when shared_dir is set"""
+    def __init__(self, buckets=DEFAULT_BUCKETS, shared_dir=None,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.buckets = buckets
+        self.shared_dir = (os.environ.get(METRICS_SHARED_DIR_ENV) if shared_dir is None
+                           else shared_dir)
+        self.flush_interval = flush_interval
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+            _shared_metrics.add(self)
+        self.request_duration = Histogram(
+            "http_request_duration_seconds", "Time spent serving requests.",
+            ("method", "route", "status"), buckets)
+        self.stage_duration = Histogram(
+            "stage_duration_seconds",
+            "Time spent in stages of requests such as upstream fetch or parsing.",
+            ("stage", "target"), buckets)
+        self.in_flight = Gauge("http_requests_in_flight", "Requests being served now.")
+
+    @contextmanager
+    def timed(self, stage: str, target: str = ""):
+        """measure time of the block as a stage of request"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_duration.observe(time.perf_counter() - start, stage, target)
+
+    def render(self) -> str:
+        """all metrics in prometheus text format"""
+        if not self.shared_dir:
+            return self._render_local()
+        self.flush()
+        combined = Metrics(self.buckets, shared_dir="")
+        for path in glob.glob(os.path.join(self.shared_dir, "metrics_*.json")):
+            try:
+                with open(path) as fin:
+                    snapshot = json.load(fin)
+            except (OSError, ValueError):
+                continue
+            combined.request_duration.add_snapshot(snapshot["request_duration"])
+            combined.stage_duration.add_snapshot(snapshot["stage_duration"])
+            # requests of finished workers are not in flight any more
+            if process_is_alive(snapshot["pid"]):
+                combined.in_flight.add(snapshot["in_flight"])
+        return combined._render_local()
+
+    def _render_local(self) -> str:
+        lines = []
+        for metric in (self.request_duration, self.stage_duration, self.in_flight):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def flush(self):
+        """write metrics of this process to shared dir"""
+        pid = os.getpid()
+        snapshot = json.dumps({
+            "pid": pid,
+            "request_duration": self.request_duration.snapshot(),
+            "stage_duration": self.stage_duration.snapshot(),
+            "in_flight": self.in_flight.value,
+        })
+        path = os.path.join(self.shared_dir, f"metrics_{pid}.json")
+        with open(f"{path}.tmp", "w") as fout:
+            fout.write(snapshot)
+        os.replace(f"{path}.tmp", path)
+
+    def start_flusher(self):
+        """flush metrics of this process every flush_interval seconds in background"""
+        if not self.shared_dir or self._flusher_pid == os.getpid():
+            return
+        with self._flusher_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_forever, daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _reset_in_child(self):
+        """observations made before fork belong to parent"""
+        self.request_duration.reset()
+        self.stage_duration.reset()
+        self.in_flight = Gauge(self.in_flight.name, self.in_flight.documentation)
+        self._flusher_pid = None
+        self._flusher_lock = threading.Lock()
+
+
+def process_is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _reset_shared_metrics_in_child():
+    for metrics in list(_shared_metrics):
+        metrics._reset_in_child()
+
+
+os.register_at_fork(after_in_child=_reset_shared_metrics_in_child)
+
+
+def instrument_app(app, metrics=None, endpoint="/metrics") -> Metrics:
+    """record latency of every request of app and serve it on endpoint"""
+    metrics = metrics or Metrics()
+
+    @app.before_request
+    def start_request_timer():
+        metrics.start_flusher()
+        g.metrics_request_start = time.perf_counter()
+        metrics.in_flight.add(1)
+
+    @app.after_request
+    def observe_request_duration(response):
+        start = g.get("metrics_request_start")
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+            metrics.request_duration.observe(
+                time.perf_counter() - start, request.method, route, response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_request(error=None):
+        if g.pop("metrics_request_start", None) is not None:
+            metrics.in_flight.add(-1)
+
+    def show_metrics():
+        return Response(metrics.render(), content_type="text/plain; version=0.0.4")
+
+    app.add_url_rule(endpoint, "metrics", show_metrics)
+    app.extensions["metrics"] = metrics
+    return metrics
@@ -0,0 +1,119 @@
+"""logging config where handlers work in background threads"""
+import atexit
+import logging
+from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import threading
+import time
+
+_listeners = {}
+
+
+class InProcessQueueHandler(QueueHandler):
+    """Queue handler which leaves message formatting to the listener thread
+
+    Records never leave the process, so they are not made picklable and
+    message arguments are interpolated only when the record is written.
+    """
+    def prepare(self, record):
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most rate records per second at or below max_level
+
+    Records above max_level are never dropped. Short bursts up to burst
+    records are allowed.
+    """
+    def __init__(self, rate: float = 100.0, burst: int = None, max_level="DEBUG",
+                 clock=time.monotonic):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self.max_level = (max_level if isinstance(max_level, int)
+                          else logging.getLevelName(max_level))
+        self.dropped = 0
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            self.dropped += 1
+            return False
+
+
+def _start_listener(log_queue, handlers):
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def setup_queued_logging(config: dict):
+    """Apply dict config and move handlers of configured loggers to background threads
+
+    Every configured logger gets its own queue and listener thread which
+    writes records to the handlers the logger had in config. Listeners of
+    loggers which are not in config are left running.
+    """
+    names = [*(["root"] if "root" in config else []), *config.get("loggers", {})]
+    for name in names:
+        _stop_listener(name)
+    dictConfig(config)
+    for name in names:
+        logger = logging.getLogger(None if name == "root" else name)
+        handlers = list(logger.handlers)
+        if not handlers:
+            continue
+        queue_handler = InProcessQueueHandler(queue.SimpleQueue())
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        _listeners[name] = (logger, queue_handler, _start_listener(queue_handler.queue, handlers))
+
+
+def _stop_listener(name):
+    """write queued records and give handlers back to the logger"""
+    if name not in _listeners:
+        return
+    logger, queue_handler, listener = _listeners.pop(name)
+    listener.stop()
+    logger.removeHandler(queue_handler)
+    for handler in listener.handlers:
+        logger.addHandler(handler)
+
+
+def stop_queued_logging():
+    """Write all queued records and stop listener threads
+
+    Loggers write records with their own handlers afterwards.
+    """
+    for name in list(_listeners):
+        _stop_listener(name)
+
+
+def _restart_listeners_in_child():
+    """Threads are not copied by fork, so child gets its own listeners
+
+    Queues are replaced too, records queued by parent before fork are
+    written by parent only.
+    """
+    for name, (logger, queue_handler, listener) in _listeners.items():
+        queue_handler.queue = queue.SimpleQueue()
+        _listeners[name] = (logger, queue_handler,
+                            _start_listener(queue_handler.queue, listener.handlers))
+
+
+atexit.register(stop_queued_logging)
+os.register_at_fork(after_in_child=_restart_listeners_in_child)
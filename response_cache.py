@@ -0,0 +1,100 @@
+"""bounded in-memory cache with request coalescing"""
+from collections import OrderedDict
+import threading
+import time
+
+
+class _Flight:
+    """Value which is being computed by one of the threads"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """LRU cache whose entries expire after ttl seconds
+
+    Concurrent misses of the same key are coalesced: the first caller
+    computes the value and the others wait for it instead of computing
+    it again. With max_weight set, the weights of entries given by weigh
+    are kept at most max_weight in total as well.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0, clock=time.monotonic,
+                 max_weight: int = None, weigh=None):
+        """Init empty cache"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self.weight = 0
+        self._weigh = weigh if weigh is not None else (lambda value: 1)
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._flights = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute, cacheable=None):
+        """Return cached value for key or compute it once for all waiting callers
+
+        Values for which cacheable returns False are passed to the callers
+        waiting for them, but are not stored.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and (cacheable is None or cacheable(flight.value)):
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _store(self, key, value):
+        weight = self._weigh(value) if self.max_weight is not None else 0
+        if self.max_weight is not None and weight > self.max_weight:
+            return
+        self._remove(key)
+        self._entries[key] = (self._clock() + self.ttl, value, weight)
+        self.weight += weight
+        while len(self._entries) > self.maxsize or (
+                self.max_weight is not None and self.weight > self.max_weight):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
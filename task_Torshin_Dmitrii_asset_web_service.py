@@ -1,48 +1,69 @@
+import bisect
+from collections import defaultdict
+import csv
+import io
+import json
+import os
+import threading
+
 from flask import Flask, abort, jsonify, request
-from bs4 import BeautifulSoup
+from lxml import etree
+import numpy as np
 import requests
 
+from asset_storage import SqliteAssetStorage
+from metrics import instrument_app
+
 
 app = Flask(__name__)
+metrics = instrument_app(app)
 
 DAILY_CURRENCY_LINK = "https://www.cbr.ru/eng/currency_base/daily/"
 KEY_INDICATORS_LINK = "https://www.cbr.ru/eng/key-indicators/"
+MAX_STEPWISE_PERIOD = 100
+# assets are kept only in memory unless path to sqlite database is given
+ASSET_STORAGE_PATH = os.environ.get("ASSET_STORAGE_PATH")
+BULK_FIELDS = ("char_code", "name", "capital", "interest")
+CSV_CONTENT_TYPES = ("text/csv",)
+JSON_LINES_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+
+
+# xpath expressions are compiled once, rows after the header one are parsed
+DAILY_CURRENCY_ROWS = etree.XPath("((//tbody)[1]//tr)[position() > 1]")
+KEY_INDICATOR_TABLES = etree.XPath(
+    "//div[@class='key-indicator_content offset-md-2']")
+KEY_INDICATOR_ROWS = etree.XPath("((.//tbody)[1]//tr)[position() > 1]")
+KEY_INDICATOR_NAME = etree.XPath(
+    "string((.//div[@class='col-md-3 offset-md-1 _subinfo'])[1])")
+TABLE_CELLS = etree.XPath(".//td")
+TEXT = etree.XPath("string()")
 
 
 def parse_cbr_currency_base_daily(document):
     """returns currencies from hmtl file into dict"""
     currency_dict = {}
-    soup = BeautifulSoup(document, 'html.parser')
-    table = soup.find('tbody')
-    for index, line in enumerate(table.find_all('tr')):
-        if index > 0:
-            items = line.find_all('td')
-            currency_dict[items[1].get_text()] = round(float(items[4].get_text()) / \
-                int(items[2].get_text()), 8)
+    root = etree.fromstring(document, etree.HTMLParser())
+    for line in DAILY_CURRENCY_ROWS(root):
+        items = TABLE_CELLS(line)
+        currency_dict[TEXT(items[1])] = round(float(TEXT(items[4])) / \
+            int(TEXT(items[2])), 8)
     return currency_dict
 
 
 def parse_cbr_key_indicators(document):
     """puts indicators from hmtl file into dict"""
     indicators_dict = {}
-    soup = BeautifulSoup(document, 'html.parser')
-    currencies = soup.find("div", {"class": "key-indicator_content offset-md-2"})
-    currencies_table = currencies.find('tbody')
-    for index, line in enumerate(currencies_table.find_all('tr')):
-        if index > 0:
-            currency = line.find("div", \
-                {"class": "col-md-3 offset-md-1 _subinfo"}).get_text()
-            value = line.find_all("td")[2].get_text()
-            indicators_dict[currency] = float(value)
-
-    metals = soup.find_all("div", {"class": "key-indicator_content offset-md-2"})[1]
-    metals_table = metals.find('tbody')
-    for index, line in enumerate(metals_table.find_all('tr')):
-        if index > 0:
-            metal = line.find("div", \
-                {"class": "col-md-3 offset-md-1 _subinfo"}).get_text()
-            value = line.find_all("td")[1].get_text()
-            indicators_dict[metal] = float(value.replace(",", ""))
+    root = etree.fromstring(document, etree.HTMLParser())
+    currencies, metals = KEY_INDICATOR_TABLES(root)[:2]
+    for line in KEY_INDICATOR_ROWS(currencies):
+        currency = KEY_INDICATOR_NAME(line)
+        value = TEXT(TABLE_CELLS(line)[2])
+        indicators_dict[currency] = float(value)
+
+    for line in KEY_INDICATOR_ROWS(metals):
+        metal = KEY_INDICATOR_NAME(line)
+        value = TEXT(TABLE_CELLS(line)[1])
+        indicators_dict[metal] = float(value.replace(",", ""))
 
     return indicators_dict
 
@@ -59,23 +80,27 @@ def cbr_unavailable(error):
 	return "CBR service is unavailable", 503
 
 
+def fetch_cbr_page(link, parser):
+    """download cbr page and parse it, abort with 503 if cbr is unavailable"""
+    with metrics.timed("upstream", link):
+        cbr_response = requests.get(link)
+    if not cbr_response.ok:
+        abort(503)
+    with metrics.timed("parse", link):
+        return parser(cbr_response.text)
+
+
 @app.route('/cbr/daily')
 def get_cbr_daily_currencies():
     """api to get json data from cbr currencies"""
-    cbr_response = requests.get(DAILY_CURRENCY_LINK)
-    if not cbr_response.ok:
-        abort(503)
-    currency_dict = parse_cbr_currency_base_daily(cbr_response.text)
+    currency_dict = fetch_cbr_page(DAILY_CURRENCY_LINK, parse_cbr_currency_base_daily)
     return jsonify(currency_dict)
 
 
 @app.route('/cbr/key_indicators')
 def get_cbr_key_indicators():
     """api to get json data from cbr indicators"""
-    cbr_response = requests.get(KEY_INDICATORS_LINK)
-    if not cbr_response.ok:
-        abort(503)
-    indicators_dict = parse_cbr_key_indicators(cbr_response.text)
+    indicators_dict = fetch_cbr_page(KEY_INDICATORS_LINK, parse_cbr_key_indicators)
     return jsonify(indicators_dict)
 
 
@@ -93,39 +118,199 @@ class Asset:
         revenue = self.capital * ((1.0 + self.interest) ** years - 1.0)
         return revenue
 
+    def to_list(self) -> list:
+        """Asset description as it is shown by api"""
+        return [self.char_code, self.name, round(self.capital, 8), \
+            round(self.interest, 8)]
+
 
 class CompositeAsset:
-    """Bank of assets"""
-    def __init__(self, assets=None):
+    """Bank of assets indexed by name and char code
+
+    With storage every change is written there first and the bank catches up
+    with changes made by other processes before serving reads.
+    """
+    def __init__(self, assets=None, storage=None):
         """Init composite of assets"""
-        self.assets = []
-        self.assets.extend(assets or [])
+        self._lock = threading.RLock()
+        self._storage = storage
+        self._storage_generation = None
+        self._storage_last_id = 0
+        self._storage_data_version = None
+        self._reset_indexes()
+        self.sync()
+        self.add_many(assets or [])
+
+    def _reset_indexes(self):
+        """Drop all assets from memory"""
+        self._assets_by_name = {}
+        self._assets_by_char_code = defaultdict(dict)
+        self._sorted_keys = []
+        self._sorted_snapshot = None
+        self._columns = None
+
+    def _index_assets(self, assets):
+        """Put assets with new names into indexes"""
+        keys = []
+        for asset in assets:
+            self._assets_by_name[asset.name] = asset
+            self._assets_by_char_code[asset.char_code][asset.name] = asset
+            keys.append((asset.char_code, asset.name))
+        if len(keys) == 1:
+            bisect.insort(self._sorted_keys, keys[0])
+        elif keys:
+            self._sorted_keys.extend(keys)
+            self._sorted_keys.sort()
+        self._sorted_snapshot = None
+        self._columns = None
+
+    def sync(self):
+        """Apply changes which were written to storage by other processes"""
+        if self._storage is None:
+            return
+        with self._lock:
+            data_version = self._storage.data_version()
+            if data_version != self._storage_data_version:
+                self._load_storage_changes()
+                self._storage_data_version = data_version
+
+    def _load_storage_changes(self):
+        generation, last_id, rows = self._storage.changes(
+            self._storage_generation, self._storage_last_id)
+        if generation != self._storage_generation:
+            self._reset_indexes()
+        self._storage_generation = generation
+        self._storage_last_id = last_id
+        self._index_assets(Asset(*row) for row in rows)
+
+    def __contains__(self, name) -> bool:
+        self.sync()
+        return name in self._assets_by_name
+
+    def __len__(self) -> int:
+        self.sync()
+        return len(self._assets_by_name)
+
+    @property
+    def assets(self) -> list:
+        """Snapshot of assets in insertion order"""
+        with self._lock:
+            self.sync()
+            return list(self._assets_by_name.values())
 
     def calculate_revenue(self, years: int, rates_dict) -> float:
         """Calculate revenue of all assets included"""
-        revenue = 0
-        for asset in self.assets:
-            try:
-                rate = rates_dict[asset.char_code]
-            except Exception:
-                rate = 1
-            revenue += rate * asset.calculate_revenue(years)
-            print(revenue)
-        return revenue
-
-    def add(self, asset: Asset):
-        """Add new asset to list"""
-        self.assets.append(asset)
-
-
-app.bank = CompositeAsset()
+        return float(self.calculate_revenues([years], rates_dict)[0])
+
+    def calculate_revenues(self, periods, rates_dict) -> np.ndarray:
+        """Calculate revenue of all assets for every period at once
+
+        Assets without rate in rates_dict are counted in roubles.
+        """
+        capital, interest, char_code_ids, char_codes = self._get_columns()
+        periods = np.asarray(periods, dtype=np.int64)
+        rates = np.array([rates_dict.get(char_code, 1) for char_code in char_codes],
+                         dtype=np.float64)
+        weights = rates[char_code_ids] * capital
+        growth = 1.0 + interest
+        if periods.size and 0 <= periods.min() and periods.max() <= MAX_STEPWISE_PERIOD:
+            # growth ** k for k = 1..max period costs one multiplication per step
+            power = np.ones_like(growth)
+            revenues = np.zeros(periods.max() + 1)
+            for step in range(1, periods.max() + 1):
+                power *= growth
+                revenues[step] = weights @ (power - 1.0)
+            return revenues[periods]
+        return weights @ (np.power.outer(growth, periods.astype(np.float64)) - 1.0)
+
+    def _get_columns(self):
+        """Capital, interest and char code columns of assets, cached until modified"""
+        with self._lock:
+            self.sync()
+            if self._columns is None:
+                assets = self._assets_by_name.values()
+                char_codes = list(self._assets_by_char_code)
+                char_code_index = {char_code: index
+                                   for index, char_code in enumerate(char_codes)}
+                self._columns = (
+                    np.fromiter((asset.capital for asset in assets),
+                                dtype=np.float64, count=len(assets)),
+                    np.fromiter((asset.interest for asset in assets),
+                                dtype=np.float64, count=len(assets)),
+                    np.fromiter((char_code_index[asset.char_code] for asset in assets),
+                                dtype=np.int64, count=len(assets)),
+                    char_codes,
+                )
+            return self._columns
+
+    def add(self, asset: Asset) -> bool:
+        """Add new asset, returns False if asset name is already taken"""
+        return bool(self.add_many([asset]))
+
+    def add_many(self, assets) -> list:
+        """Add assets in one batch, returns those whose names were not taken"""
+        with self._lock:
+            self.sync()
+            new_assets = {}
+            for asset in assets:
+                if asset.name not in self._assets_by_name:
+                    new_assets.setdefault(asset.name, asset)
+            new_assets = list(new_assets.values())
+            if self._storage is None:
+                self._index_assets(new_assets)
+                return new_assets
+            if not new_assets:
+                return []
+            # other processes may have taken some of the names meanwhile
+            inserted_names = set(self._storage.add_many(
+                (asset.char_code, asset.name, asset.capital, asset.interest)
+                for asset in new_assets))
+            self._load_storage_changes()
+            return [asset for asset in new_assets if asset.name in inserted_names]
+
+    def clear(self):
+        """Remove all assets"""
+        with self._lock:
+            if self._storage is None:
+                self._reset_indexes()
+            else:
+                self._storage.clear()
+                self._load_storage_changes()
+
+    def get(self, names) -> list:
+        """Assets with given names, unknown names are skipped"""
+        with self._lock:
+            self.sync()
+            return [self._assets_by_name[name] for name in dict.fromkeys(names)
+                    if name in self._assets_by_name]
+
+    def get_by_char_code(self, char_code: str) -> list:
+        """Assets nominated in given currency or metal"""
+        with self._lock:
+            self.sync()
+            return list(self._assets_by_char_code.get(char_code, {}).values())
+
+    def sorted_list(self) -> tuple:
+        """Descriptions of all assets sorted by char code and name
+
+        Snapshot is built once after each modification and shared by readers.
+        """
+        with self._lock:
+            self.sync()
+            if self._sorted_snapshot is None:
+                self._sorted_snapshot = tuple(
+                    self._assets_by_name[name].to_list() for _, name in self._sorted_keys)
+            return self._sorted_snapshot
+
+
+app.bank = CompositeAsset(
+    storage=SqliteAssetStorage(ASSET_STORAGE_PATH) if ASSET_STORAGE_PATH else None)
 
 @app.route('/api/asset/add/<char_code>/<name>/<capital>/<interest>')
 def add_asset_to_bank(char_code, name, capital, interest):
     """api which creates Asset object and adds it to the bank"""
-    for asset in app.bank.assets:
-        if asset.name == name:
-            abort(403)
+    if name in app.bank:
+        abort(403)
 
     try:
         capital = float(capital)
@@ -134,23 +319,100 @@ def add_asset_to_bank(char_code, name, capital, interest):
         abort(404)
 
     new_asset = Asset(char_code, name, capital, interest)
-    app.bank.add(new_asset)
+    if not app.bank.add(new_asset):
+        abort(403)
     return f"Asset {name} was successfully added"
 
 
+def read_bulk_rows(stream, content_type):
+    """yield row number, list of fields and error of every row of streamed body
+
+    Fields are None when error is set. Rows which are not valid utf-8 are
+    reported instead of failing the whole body.
+    """
+    # csv module handles newlines inside quoted fields itself
+    lines = io.TextIOWrapper(stream, encoding="utf-8", errors="surrogateescape", newline="")
+    if content_type in CSV_CONTENT_TYPES:
+        rows = enumerate(csv.reader(lines), start=1)
+    else:
+        rows = ((row_number, line) for row_number, line in enumerate(lines, start=1)
+                if line.strip())
+    for row_number, row in rows:
+        try:
+            "".join(row).encode("utf-8")
+        except UnicodeEncodeError:
+            yield row_number, None, "row is not valid utf-8"
+            continue
+        if content_type in CSV_CONTENT_TYPES:
+            if row and row != list(BULK_FIELDS):
+                yield row_number, row, None
+            continue
+        try:
+            record = json.loads(row)
+            yield row_number, [record[field] for field in BULK_FIELDS], None
+        except (ValueError, TypeError, KeyError):
+            yield row_number, None, "malformed row"
+
+
+@app.route('/api/asset/add_bulk', methods=['POST'])
+def add_assets_to_bank_in_bulk():
+    """api which adds assets from json lines or csv body in one batch"""
+    content_type = request.mimetype
+    if content_type not in CSV_CONTENT_TYPES + JSON_LINES_CONTENT_TYPES:
+        abort(415)
+
+    errors = []
+    new_assets = {}
+    for row_number, record, error in read_bulk_rows(request.stream, content_type):
+        if error is None and len(record) != len(BULK_FIELDS):
+            error = "malformed row"
+        if error is not None:
+            errors.append({"row": row_number, "error": error})
+            continue
+        char_code, name, capital, interest = record
+        if not (isinstance(char_code, str) and char_code and isinstance(name, str) and name):
+            errors.append({"row": row_number,
+                           "error": "char_code and name must be non empty strings"})
+            continue
+        try:
+            # json escapes such as \ud800 decode to lone surrogates
+            char_code.encode("utf-8")
+            name.encode("utf-8")
+        except UnicodeEncodeError:
+            errors.append({"row": row_number, "error": "row is not valid utf-8"})
+            continue
+        try:
+            capital = float(capital)
+            interest = float(interest)
+        except (ValueError, TypeError):
+            errors.append({"row": row_number, "error": "capital and interest must be numbers"})
+            continue
+        if name in new_assets:
+            errors.append({"row": row_number, "error": f"asset {name} already exists"})
+            continue
+        new_assets[name] = (row_number, Asset(char_code, name, capital, interest))
+
+    # add_many skips names already in the bank, they are reported by row here
+    added = app.bank.add_many(asset for _, asset in new_assets.values())
+    if len(added) < len(new_assets):
+        added_names = {asset.name for asset in added}
+        for name, (row_number, _) in new_assets.items():
+            if name not in added_names:
+                errors.append({"row": row_number, "error": f"asset {name} already exists"})
+        errors.sort(key=lambda error: error["row"])
+    return jsonify({"added": len(added), "errors": errors})
+
+
 @app.route('/api/asset/list')
 def show_list_of_assets_to_json():
     """show list of assets in the bank"""
-    assets = app.bank.assets
-    assets_list = [[asset.char_code, asset.name, round(asset.capital, 8), \
-        round(asset.interest, 8)] for asset in assets]
-    return jsonify(sorted(assets_list))
+    return jsonify(app.bank.sorted_list())
 
 
 @app.route('/api/asset/cleanup')
 def remove_all_assets_from_bank():
     """empty bank of assets"""
-    app.bank.assets = []
+    app.bank.clear()
     return "All assets were removed"
 
 
@@ -158,35 +420,25 @@ def remove_all_assets_from_bank():
 def get_assets_info():
     """get info about interesting assets to json"""
     good_asset_names = request.args.getlist('name')
-    assets_list = []
-    for asset in app.bank.assets:
-        if asset.name in good_asset_names:
-            assets_list.append([asset.char_code, asset.name, \
-                round(asset.capital, 8), round(asset.interest, 8)])
+    assets_list = [asset.to_list() for asset in app.bank.get(good_asset_names)]
     return jsonify(sorted(assets_list))
 
 
 @app.route('/api/asset/calculate_revenue')
 def calculate_revenue():
     """Get total revenue of listed periods"""
-    periods = request.args.getlist('period')
+    periods = [int(period) for period in request.args.getlist('period')]
     result = {}
 
-    cbr_response = requests.get(KEY_INDICATORS_LINK)
-    if not cbr_response.ok:
-        abort(503)
-    indicators_dict = parse_cbr_key_indicators(cbr_response.text)
-
-    cbr_response = requests.get(DAILY_CURRENCY_LINK)
-    if not cbr_response.ok:
-        abort(503)
-    currency_dict = parse_cbr_currency_base_daily(cbr_response.text)
+    indicators_dict = fetch_cbr_page(KEY_INDICATORS_LINK, parse_cbr_key_indicators)
+    currency_dict = fetch_cbr_page(DAILY_CURRENCY_LINK, parse_cbr_currency_base_daily)
     del currency_dict['USD']
     del currency_dict['EUR']
 
     rates_dict = {**indicators_dict, **currency_dict}
 
-    for period in periods:
-        period = int(period)
-        result[period] = round(app.bank.calculate_revenue(years=period, rates_dict=rates_dict), 8)
+    with metrics.timed("revenue"):
+        revenues = app.bank.calculate_revenues(periods, rates_dict)
+    for period, revenue in zip(periods, revenues):
+        result[period] = round(float(revenue), 8)
     return jsonify(result)
@@ -1,15 +1,23 @@
 #!usr/bin/env python3
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 # from storage_policy import JsonStoragePolicy, PickleStoragePolicy, ZlibStoragePolicy
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, FileType
 from io import TextIOWrapper
 import sys
 from argparse import ArgumentTypeError
 import struct
+from array import array
+from bisect import bisect_left
+import gc
+import mmap
+import zlib
 
 DEFAULT_DATASET_PATH = '../resourses/wikipedia.sample'
 DEFAULT_INVERTED_INDEX_STORE_PATH = 'inverted.index'
+DEFAULT_DOCUMENT_STORE_PATH = 'documents.store'
+DEFAULT_QUERY_WORKERS = 1
+DEFAULT_QUERY_CHUNK_SIZE = 256
 SPLIT = chr(500000).encode('utf-8')
 
 
@@ -39,6 +47,322 @@ class StoragePolicy:
         return data
 
 
+# document ids are grouped by high 16 bits into containers, like in Roaring
+# bitmaps: sparse groups are sorted arrays, dense groups are bitmaps
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+LOW_BITS_MASK = CONTAINER_SIZE - 1
+BITMAP_BYTES = CONTAINER_SIZE // 8
+ARRAY_CONTAINER_LIMIT = 4096
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+HYBRID_INDEX_MAGIC = b'HYBRIDX1'
+ARRAY_CONTAINER, BITMAP_CONTAINER = 0, 1
+TERM_HEADER = struct.Struct('<II')
+CONTAINER_HEADER = struct.Struct('<IBI')
+DOCUMENT_STORE_MAGIC = b'DOCSTOR1'
+DOCUMENT_STORE_FOOTER = struct.Struct('<QII')
+DOCUMENT_BLOCK_SIZE = 64
+DOCUMENT_BLOCK_CACHE_SIZE = 16
+SNIPPET_WIDTH = 20
+# arrays are intersected by binary search when one is this many times longer
+GALLOP_RATIO = 16
+HIGHLIGHT_START, HIGHLIGHT_END = '**', '**'
+
+
+def array_to_bitmap(container) -> int:
+    """bitmap of 2**16 bits with bits of container values set"""
+    bitmap = bytearray(BITMAP_BYTES)
+    for low in container:
+        bitmap[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(bitmap, 'little')
+
+
+def bitmap_to_array(bitmap: int):
+    """sorted array of positions of set bits"""
+    bitmap = bitmap.to_bytes(BITMAP_BYTES, 'little')
+    return array('H', [index << 3 | bit for index, byte in enumerate(bitmap) if byte
+                       for bit in BYTE_BITS[byte]])
+
+
+def optimize_container(container):
+    """choose array or bitmap representation by number of values"""
+    if isinstance(container, int):
+        if container.bit_count() <= ARRAY_CONTAINER_LIMIT:
+            return bitmap_to_array(container)
+        return container
+    if len(container) > ARRAY_CONTAINER_LIMIT:
+        return array_to_bitmap(container)
+    return container
+
+
+def gallop_intersection(smaller, larger):
+    """values of smaller found in larger by binary search from last match"""
+    result = array('H')
+    position = 0
+    length = len(larger)
+    for value in smaller:
+        position = bisect_left(larger, value, position)
+        if position == length:
+            break
+        if larger[position] == value:
+            result.append(value)
+    return result
+
+
+def intersect_containers(first, second):
+    """Only bitmap & bitmap is word parallel
+
+    Array & bitmap tests every array value against the bitmap, arrays of
+    very different length are galloped and arrays of similar length are
+    intersected as sets, which is faster than a merge loop in python.
+    """
+    if isinstance(first, int) and isinstance(second, int):
+        return optimize_container(first & second)
+    if isinstance(first, int):
+        first, second = second, first
+    if isinstance(second, int):
+        bitmap = second.to_bytes(BITMAP_BYTES, 'little')
+        return array('H', [low for low in first if bitmap[low >> 3] >> (low & 7) & 1])
+    if len(first) > len(second):
+        first, second = second, first
+    if len(first) * GALLOP_RATIO < len(second):
+        return gallop_intersection(first, second)
+    return array('H', sorted(set(first).intersection(second)))
+
+
+def unite_containers(first, second):
+    if isinstance(first, int) or isinstance(second, int):
+        if not isinstance(first, int):
+            first = array_to_bitmap(first)
+        if not isinstance(second, int):
+            second = array_to_bitmap(second)
+        return first | second
+    return optimize_container(array('H', sorted(set(first).union(second))))
+
+
+class PostingList:
+    """Sorted set of document ids stored in array and bitmap containers"""
+    __slots__ = ('containers',)
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, document_ids):
+        groups = defaultdict(list)
+        for document_id in sorted(set(document_ids)):
+            groups[document_id >> CONTAINER_BITS].append(document_id & LOW_BITS_MASK)
+        return cls({high: optimize_container(array('H', lows))
+                    for high, lows in groups.items()})
+
+    def __iter__(self):
+        for high in sorted(self.containers):
+            container = self.containers[high]
+            if isinstance(container, int):
+                container = bitmap_to_array(container)
+            base = high << CONTAINER_BITS
+            for low in container:
+                yield base | low
+
+    def __len__(self):
+        return sum(container.bit_count() if isinstance(container, int) else len(container)
+                   for container in self.containers.values())
+
+    def __eq__(self, other):
+        if isinstance(other, (PostingList, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f'PostingList({list(self)})'
+
+    def intersection(self, other):
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            container = intersect_containers(self.containers[high], other.containers[high])
+            if container:
+                containers[high] = container
+        return PostingList(containers)
+
+    def union(self, other):
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            if high in containers:
+                container = unite_containers(containers[high], container)
+            containers[high] = container
+        return PostingList(containers)
+
+
+class HybridStoragePolicy:
+    """Binary index with posting lists stored as array or bitmap containers"""
+    @staticmethod
+    def dump(word_to_docs_mapping, filepath: str):
+        print(f'dump dataset to {filepath}', file=sys.stderr)
+        with open(filepath, 'wb') as f:
+            f.write(HYBRID_INDEX_MAGIC)
+            for word, document_ids in word_to_docs_mapping.items():
+                if not isinstance(document_ids, PostingList):
+                    document_ids = PostingList.from_ids(document_ids)
+                word = word.encode('utf-8')
+                f.write(TERM_HEADER.pack(len(word), len(document_ids.containers)))
+                f.write(word)
+                for high, container in sorted(document_ids.containers.items()):
+                    if isinstance(container, int):
+                        f.write(CONTAINER_HEADER.pack(high, BITMAP_CONTAINER, BITMAP_BYTES))
+                        f.write(container.to_bytes(BITMAP_BYTES, 'little'))
+                    else:
+                        if sys.byteorder != 'little':
+                            container = array('H', container)
+                            container.byteswap()
+                        f.write(CONTAINER_HEADER.pack(high, ARRAY_CONTAINER, len(container)))
+                        f.write(container.tobytes())
+
+    @staticmethod
+    def load(filepath: str):
+        data = {}
+        print(f'load dataset from {filepath}', file=sys.stderr)
+        with open(filepath, 'rb') as f:
+            s = memoryview(f.read())
+        offset = len(HYBRID_INDEX_MAGIC)
+        while offset < len(s):
+            word_length, container_count = TERM_HEADER.unpack_from(s, offset)
+            offset += TERM_HEADER.size
+            word = bytes(s[offset:offset + word_length]).decode('utf-8')
+            offset += word_length
+            containers = {}
+            for _ in range(container_count):
+                high, kind, length = CONTAINER_HEADER.unpack_from(s, offset)
+                offset += CONTAINER_HEADER.size
+                if kind == BITMAP_CONTAINER:
+                    containers[high] = int.from_bytes(s[offset:offset + length], 'little')
+                    offset += length
+                else:
+                    container = array('H')
+                    container.frombytes(s[offset:offset + 2 * length])
+                    if sys.byteorder != 'little':
+                        container.byteswap()
+                    containers[high] = container
+                    offset += 2 * length
+            data[word] = PostingList(containers)
+        return data
+
+
+def detect_storage_policy(filepath: str):
+    """hybrid policy for indexes written by it, old policy for the rest"""
+    with open(filepath, 'rb') as f:
+        if f.read(len(HYBRID_INDEX_MAGIC)) == HYBRID_INDEX_MAGIC:
+            return HybridStoragePolicy
+    return StoragePolicy
+
+
+class DocumentStore:
+    """Compressed documents with random access by document id
+
+    Documents are zlib compressed in blocks of DOCUMENT_BLOCK_SIZE. The file
+    ends with tables of block offsets and of document id -> (block, position)
+    and is read through mmap, so only blocks of requested documents are
+    decompressed. A few recently used blocks are kept decompressed.
+    """
+    def __init__(self, filepath: str, cache_size: int = DOCUMENT_BLOCK_CACHE_SIZE):
+        self.filepath = filepath
+        self.cache_size = cache_size
+        self._block_cache = OrderedDict()
+        with open(filepath, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(DOCUMENT_STORE_MAGIC)] != DOCUMENT_STORE_MAGIC:
+            raise ValueError(f'{filepath} is not a document store')
+        footer_offset = len(self._mmap) - DOCUMENT_STORE_FOOTER.size
+        tables_offset, block_count, document_count = DOCUMENT_STORE_FOOTER.unpack_from(
+            self._mmap, footer_offset)
+        self._block_offsets = self._read_table('Q', tables_offset, block_count + 1)
+        tables_offset += 8 * (block_count + 1)
+        self._document_ids = self._read_table('q', tables_offset, document_count)
+        tables_offset += 8 * document_count
+        self._document_blocks = self._read_table('I', tables_offset, document_count)
+        tables_offset += 4 * document_count
+        self._document_positions = self._read_table('I', tables_offset, document_count)
+
+    def _read_table(self, typecode, offset, length):
+        table = array(typecode)
+        table.frombytes(self._mmap[offset:offset + table.itemsize * length])
+        if sys.byteorder != 'little':
+            table.byteswap()
+        return table
+
+    @staticmethod
+    def dump(documents, filepath: str, block_size: int = DOCUMENT_BLOCK_SIZE):
+        """write lines starting with document id into store"""
+        print(f'dump documents to {filepath}', file=sys.stderr)
+        texts = {}
+        for document in documents:
+            document_id, *text = document.split(maxsplit=1)
+            texts.setdefault(int(document_id), ' '.join(text).strip())
+        document_ids = sorted(texts)
+        block_offsets = array('Q')
+        document_blocks = array('I')
+        document_positions = array('I')
+        with open(filepath, 'wb') as f:
+            f.write(DOCUMENT_STORE_MAGIC)
+            for start in range(0, len(document_ids), block_size):
+                block_ids = document_ids[start:start + block_size]
+                block_offsets.append(f.tell())
+                block = '\n'.join(texts[document_id] for document_id in block_ids)
+                f.write(zlib.compress(block.encode('utf-8')))
+                document_blocks.extend([len(block_offsets) - 1] * len(block_ids))
+                document_positions.extend(range(len(block_ids)))
+            tables_offset = f.tell()
+            block_offsets.append(tables_offset)
+            for table in (block_offsets, array('q', document_ids),
+                          document_blocks, document_positions):
+                if sys.byteorder != 'little':
+                    table.byteswap()
+                f.write(table.tobytes())
+            f.write(DOCUMENT_STORE_FOOTER.pack(
+                tables_offset, len(block_offsets) - 1, len(document_ids)))
+
+    def _block(self, block_number: int) -> list:
+        block = self._block_cache.get(block_number)
+        if block is not None:
+            self._block_cache.move_to_end(block_number)
+            return block
+        start, end = self._block_offsets[block_number], self._block_offsets[block_number + 1]
+        block = zlib.decompress(self._mmap[start:end]).decode('utf-8').split('\n')
+        self._block_cache[block_number] = block
+        if len(self._block_cache) > self.cache_size:
+            self._block_cache.popitem(last=False)
+        return block
+
+    def get(self, document_id: int):
+        """text of document or None if there is no such document"""
+        index = bisect_left(self._document_ids, document_id)
+        if index == len(self._document_ids) or self._document_ids[index] != document_id:
+            return None
+        block = self._block(self._document_blocks[index])
+        return block[self._document_positions[index]]
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def make_snippet(text: str, words, width: int = SNIPPET_WIDTH) -> str:
+    """part of text around first query word with query words highlighted"""
+    tokens = text.split()
+    words = set(words)
+    first = next((index for index, token in enumerate(tokens) if token in words), 0)
+    start = max(first - width // 2, 0)
+    snippet = [f'{HIGHLIGHT_START}{token}{HIGHLIGHT_END}' if token in words else token
+               for token in tokens[start:start + width]]
+    prefix = '... ' if start > 0 else ''
+    suffix = ' ...' if start + width < len(tokens) else ''
+    return prefix + ' '.join(snippet) + suffix
+
+
 class EncodedFileType(FileType):
     def __call__(self, string):
         # the special argument "-" means sys.std{in,out}
@@ -66,11 +390,33 @@ class InvertedIndex:
     def __init__(self):
         """Конструктор"""
         self.inverted_index = defaultdict(list)
+        self._posting_lists = {}
+
+    def posting_list(self, word: str) -> PostingList:
+        """Documents containing word as containers, built once for list postings"""
+        document_ids = self.inverted_index.get(word)
+        if isinstance(document_ids, PostingList):
+            return document_ids
+        if document_ids is None:
+            return PostingList()
+        if word not in self._posting_lists:
+            self._posting_lists[word] = PostingList.from_ids(document_ids)
+        return self._posting_lists[word]
 
     def query(self, words: list) -> list:
         """Return the list of relevant documents for the given query"""
         print(f'run query', file=sys.stderr)
-        return list(set.intersection(*[set(self.inverted_index[word]) for word in words.split()]))
+        if isinstance(words, str):
+            words = words.split()
+        if not words:
+            return []
+        posting_lists = sorted(map(self.posting_list, words), key=len)
+        result = posting_lists[0]
+        for posting_list in posting_lists[1:]:
+            if not result.containers:
+                break
+            result = result.intersection(posting_list)
+        return list(result)
 
     def dump(self, filepath: str, storage_policy):
         storage_policy.dump(self.inverted_index, filepath)
@@ -117,6 +463,11 @@ def setup_parser(parser):
         dest = 'inverted_index_filepath',
         help = 'path to store index in binary format',
     )
+    build_parser.add_argument(
+        "--documents-output", default = DEFAULT_DOCUMENT_STORE_PATH,
+        dest = 'document_store_filepath',
+        help = 'path to store compressed documents for snippets',
+    )
     build_parser.set_defaults(callback = build_callback)
 
     query_parser = subparsers.add_parser(
@@ -128,6 +479,23 @@ def setup_parser(parser):
         dest = "inverted_index_filepath",
         help = 'path to read index in binary format',
     )
+    query_parser.add_argument(
+        '--with-snippets', action = 'store_true',
+        help = 'print document id and snippet of every found document after ids',
+    )
+    query_parser.add_argument(
+        '--documents', default = DEFAULT_DOCUMENT_STORE_PATH,
+        dest = 'document_store_filepath',
+        help = 'path to read documents for snippets',
+    )
+    query_parser.add_argument(
+        '--workers', type = int, default = DEFAULT_QUERY_WORKERS,
+        help = 'number of processes answering queries, index is shared by fork',
+    )
+    query_parser.add_argument(
+        '--chunk-size', type = int, default = DEFAULT_QUERY_CHUNK_SIZE,
+        help = 'number of queries sent to worker at once',
+    )
     query_file_group = query_parser.add_mutually_exclusive_group(required=True)
     query_file_group.add_argument(
         '-q', '--query',
@@ -139,14 +507,12 @@ def setup_parser(parser):
     query_file_group.add_argument(
         '--query-file-utf8',
         dest = 'query_file',
-        default = TextIOWrapper(sys.stdin.buffer, encoding = "utf-8"),
         type = EncodedFileType("r", encoding = 'utf-8'),
         help = 'query file to get queries to run against inverted index',
     )
     query_file_group.add_argument(
         '--query-file-cp1251',
         dest = 'query_file',
-        default = TextIOWrapper(sys.stdin.buffer, encoding = "cp1251"),
         type = EncodedFileType("r", encoding = 'cp1251'),
         help = 'query file to get queries to run against inverted index',
     )
@@ -155,31 +521,110 @@ def setup_parser(parser):
 
 def build_callback(arguments):
     return process_build(arguments.dataset_filepath,
-        arguments.inverted_index_filepath)
+        arguments.inverted_index_filepath, arguments.document_store_filepath)
 
 
-def process_build(dataset, output):
+def process_build(dataset, output, documents_output=None):
     documents = load_documents(dataset)
     inverted_index = build_inverted_index(documents)
     inverted_index.dump(filepath = output, 
-                        storage_policy = StoragePolicy)
+                        storage_policy = HybridStoragePolicy)
+    if documents_output is not None:
+        DocumentStore.dump(documents, documents_output)
 
 
 def query_callback(arguments):
     return process_queries(arguments.inverted_index_filepath,
-        arguments.query_file)
-
-def process_queries(inverted_index_filepath, query_file):
+        arguments.query_file, arguments.with_snippets,
+        arguments.document_store_filepath, arguments.workers,
+        arguments.chunk_size)
+
+
+def chunked(iterable, chunk_size: int):
+    """Yield (number of first item, list of up to chunk_size items)"""
+    chunk = []
+    start = 0
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield start, chunk
+            start += chunk_size
+            chunk = []
+    if chunk:
+        yield start, chunk
+
+
+# index of parent process, workers get it by fork instead of pickling
+_worker_inverted_index = None
+
+
+def _answer_chunk(chunk):
+    start, queries = chunk
+    return start, queries, [_worker_inverted_index.query(query) for query in queries]
+
+
+def query_in_parallel(inverted_index, queries, workers: int,
+                      chunk_size: int = DEFAULT_QUERY_CHUNK_SIZE):
+    """Yield (query, document ids) in input order, answered by forked workers
+
+    Chunks are answered in any order and kept in a buffer until all chunks
+    before them are written.
+    """
+    import multiprocessing
+    global _worker_inverted_index
+    _worker_inverted_index = inverted_index
+    # objects of the index are not touched by collector in workers,
+    # so their pages stay shared with parent
+    gc.freeze()
+    try:
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            answered = {}
+            next_start = 0
+            for start, chunk_queries, answers in pool.imap_unordered(
+                    _answer_chunk, chunked(queries, chunk_size)):
+                answered[start] = zip(chunk_queries, answers)
+                while next_start in answered:
+                    for query, document_ids in answered.pop(next_start):
+                        next_start += 1
+                        yield query, document_ids
+    finally:
+        gc.unfreeze()
+        _worker_inverted_index = None
+
+
+def process_queries(inverted_index_filepath, query_file, with_snippets=False,
+                    document_store_filepath=DEFAULT_DOCUMENT_STORE_PATH,
+                    workers=DEFAULT_QUERY_WORKERS, chunk_size=DEFAULT_QUERY_CHUNK_SIZE):
     print(f"load inverted index from : {inverted_index_filepath}", 
         file = sys.stderr)
     inverted_index = InvertedIndex().load(
-        inverted_index_filepath, StoragePolicy)
-    print(f"read queries from: {query_file}", file = sys.stderr)
-    for query in query_file: 
-        query = query.strip()
-        document_ids = inverted_index.query(query)
-        document_ids = list(map(str, document_ids))
-        print(",".join(document_ids))
+        inverted_index_filepath, detect_storage_policy(inverted_index_filepath))
+    document_store = open_document_store(document_store_filepath) if with_snippets else None
+    try:
+        print(f"read queries from: {query_file}", file = sys.stderr)
+        queries = (query.strip() for query in query_file)
+        if workers > 1:
+            answers = query_in_parallel(inverted_index, queries, workers, chunk_size)
+        else:
+            answers = ((query, inverted_index.query(query)) for query in queries)
+        for query, document_ids in answers:
+            print(",".join(map(str, document_ids)))
+            if document_store is not None:
+                for document_id in document_ids:
+                    text = document_store.get(document_id) or ''
+                    print(f"{document_id}\t{make_snippet(text, query.split())}")
+    finally:
+        if document_store is not None:
+            document_store.close()
+
+
+def open_document_store(filepath: str) -> DocumentStore:
+    """document store for snippets, errors are reported like bad arguments"""
+    try:
+        return DocumentStore(filepath)
+    except (OSError, ValueError) as e:
+        message = "can't open document store '%s': %s, build index with --documents-output"
+        raise ArgumentTypeError(message % (filepath, e))
 
 
 def main():   
@@ -190,7 +635,10 @@ def main():
     )
     setup_parser(parser)
     arguments = parser.parse_args()
-    arguments.callback(arguments)
+    try:
+        arguments.callback(arguments)
+    except ArgumentTypeError as e:
+        parser.error(str(e))
 
 
 if __name__ == "__main__":
@@ -1,21 +1,26 @@
 #!/usr/bin/env python3
 """tool to get stackoverflow analytics"""
 import sys
+import os
 import logging
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser, FileType, ArgumentTypeError
 from io import TextIOWrapper
-from logging.config import dictConfig
 from collections import defaultdict, Counter
+from functools import partial
 import re
 import csv
 import json
 
-import yaml
-from lxml import etree
+from heavy_hitters import HeavyHitters, RangeHeavyHitters
+from queued_logging import setup_queued_logging
 
 DEFAULT_DATASET_PATH = "stackoverflow_small_set.xml"
 DEFAULT_STOP_WORDS_PATH = "stop_words_en.txt"
 LOG_CONFIG_PATH = "log_config.yml"
+LOG_CONFIG_CACHE_DIR = "__pycache__"
+DEFAULT_TOP_K = 1000
+DEFAULT_EPSILON = 0.0001
+DEFAULT_DELTA = 0.01
 
 
 class EncodedFileType(FileType):
@@ -67,28 +72,79 @@ def setup_parser(parser):
         metavar = "FILE",
         help = 'query to run against stackoverflow questions',
     )
+    parser.add_argument(
+        '--approximate',
+        action = 'store_true',
+        help = 'keep only heavy hitters of every year in bounded memory',
+    )
+    parser.add_argument(
+        '--top-k',
+        type = int,
+        default = DEFAULT_TOP_K,
+        help = 'number of heavy hitter words tracked per year in approximate mode',
+    )
+    parser.add_argument(
+        '--epsilon',
+        type = float,
+        default = DEFAULT_EPSILON,
+        help = 'relative error of word scores in approximate mode',
+    )
+    parser.add_argument(
+        '--delta',
+        type = float,
+        default = DEFAULT_DELTA,
+        help = 'probability to exceed error in approximate mode',
+    )
     parser.set_defaults(callback = parser_callback)
 
 
 def parser_callback(arguments):
     """get correct list of arguments"""
-    return process_queries(arguments.dataset_file, arguments.stop_words_file, arguments.query_file)
+    approximate = None
+    if arguments.approximate:
+        approximate = (arguments.top_k, arguments.epsilon, arguments.delta)
+    return process_queries(arguments.dataset_file, arguments.stop_words_file, arguments.query_file,
+                           approximate)
 
 
-def make_scorer(data_file):
-    """count score for word in stackoverflow file"""
-    scorer = defaultdict(lambda: defaultdict(int))
+def read_questions(data_file):
+    """yield year, set of title words and score of every question"""
+    from lxml import etree
     for xml in data_file:
         xml = etree.fromstring(xml)
         if xml.get('PostTypeId') == '1':
             words = set(re.findall(r"\w+", xml.get('Title').lower()))
             year = int(xml.get('CreationDate')[:4])
             score = int(xml.get('Score'))
-            for word in words:
-                scorer[year][word] += score
+            yield year, words, score
+
+
+def make_scorer(data_file):
+    """count score for word in stackoverflow file"""
+    scorer = defaultdict(lambda: defaultdict(int))
+    for year, words, score in read_questions(data_file):
+        for word in words:
+            scorer[year][word] += score
     return scorer
 
 
+def make_approximate_scorer(data_file, stop_words_file, top_k, epsilon, delta):
+    """heavy hitters of every range of years, stop words are skipped"""
+    stop_words = {line.strip() for line in stop_words_file}
+    scorer = {}
+    for year, words, score in read_questions(data_file):
+        if year not in scorer:
+            scorer[year] = HeavyHitters.from_error(top_k, epsilon, delta)
+        for word in words - stop_words:
+            scorer[year].add(word, score)
+    return RangeHeavyHitters(scorer)
+
+
+def process_approximate_query(query, scorer):
+    """get result for single query from heavy hitters of years"""
+    return scorer.top(int(query['start_year']), int(query['end_year']), int(query['top_N']))
+
+
 def fix_scorer(scorer, stop_words_file):
     """remove stop words"""
     for line in stop_words_file:
@@ -139,12 +195,22 @@ def convert_to_json(line, result):
     return res
 
 
-def process_queries(dataset_file, stop_words_file, query_file):
-    """load data, process and show result"""
+def process_queries(dataset_file, stop_words_file, query_file, approximate=None):
+    """load data, process and show result
+
+    approximate is (top_k, epsilon, delta) to answer from heavy hitters
+    instead of exact scores.
+    """
     logger = setup_logger()
-    scorer = make_scorer(dataset_file)
-    scorer = fix_scorer(scorer, stop_words_file)
-    top_words, min_year, max_year = range_scorer(scorer)
+    if approximate is None:
+        scorer = make_scorer(dataset_file)
+        scorer = fix_scorer(scorer, stop_words_file)
+        top_words, min_year, max_year = range_scorer(scorer)
+        answer = partial(process_query, scorer = top_words, min_year = min_year,
+                         max_year = max_year)
+    else:
+        scorer = make_approximate_scorer(dataset_file, stop_words_file, *approximate)
+        answer = partial(process_approximate_query, scorer = scorer)
     logger.info("process XML dataset, ready to serve queries")
     results = []
     with open(query_file, 'r') as query:
@@ -152,23 +218,54 @@ def process_queries(dataset_file, stop_words_file, query_file):
         for line in reader:
             new_line = {'start_year': line[0], 'end_year': line[1], 'top_N': line[2]}
             line = new_line
-            logger.debug('got query "{},{},{}"'.format(line['start_year'],
-                                                       line['end_year'], line['top_N']))
-            result = process_query(line, top_words, min_year, max_year)
+            logger.debug('got query "%s,%s,%s"', line['start_year'],
+                         line['end_year'], line['top_N'])
+            result = answer(line)
             if len(result) < int(line['top_N']):
-                logger.warning('not enough data to answer, found {} words out '
-                               'of {} for period "{},{}"'.format(
-                    len(result), line['top_N'], line['start_year'], line['end_year']))
+                logger.warning('not enough data to answer, found %s words out '
+                               'of %s for period "%s,%s"',
+                               len(result), line['top_N'], line['start_year'], line['end_year'])
             results.append(convert_to_json(line, result))
     logger.info("finish processing queries")
     return results
 
 
+def load_log_config(filepath=LOG_CONFIG_PATH):
+    """Read yaml logging config, parsed config is cached as json
+
+    Cache is stored in LOG_CONFIG_CACHE_DIR next to config and is used
+    while modification time and size of config are the same, so yaml is
+    not even imported on most runs.
+    """
+    stat = os.stat(filepath)
+    key = [stat.st_mtime_ns, stat.st_size]
+    cache_dir = os.path.join(os.path.dirname(filepath), LOG_CONFIG_CACHE_DIR)
+    cache_path = os.path.join(cache_dir, os.path.basename(filepath) + '.json')
+    try:
+        with open(cache_path, 'r') as cache:
+            cached = json.load(cache)
+        if cached['key'] == key:
+            return cached['config']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    import yaml
+    with open(filepath, 'r') as cfg:
+        config = yaml.safe_load(cfg)
+    try:
+        data = json.dumps({'key': key, 'config': config})
+        os.makedirs(cache_dir, exist_ok = True)
+        temporary_path = '%s.%d.tmp' % (cache_path, os.getpid())
+        with open(temporary_path, 'w') as cache:
+            cache.write(data)
+        os.replace(temporary_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        pass
+    return config
+
+
 def setup_logger():
     """read logger from config"""
-    with open(LOG_CONFIG_PATH, 'r') as cfg:
-        config = yaml.safe_load(cfg)
-    dictConfig(config)
+    setup_queued_logging(load_log_config())
     return logging.getLogger("application_logger")
 
 
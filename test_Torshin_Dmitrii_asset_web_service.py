@@ -70,4 +70,120 @@ def test_calculate_revenue(client):
     response = client.get('/api/asset/calculate_revenue?period=1&period=2')
     assert 200 == response.status_code
     good_response = '{"1":90.7932,"2":182.494332}\n'
-    assert response.data.decode(response.charset) == good_response
\ No newline at end of file
+    assert response.data.decode(response.charset) == good_response
+
+
+def test_add_asset_with_same_name_is_forbidden(client):
+    client.get('/api/asset/cleanup')
+    client.get("/api/asset/add/RUB/First/1000/1.01")
+    response = client.get("/api/asset/add/USD/First/10/0.1")
+    assert 403 == response.status_code
+    assert [["RUB", "First", 1000.0, 1.01]] == client.get('/api/asset/list').get_json()
+
+
+def test_composite_asset_indexes():
+    bank = task.CompositeAsset([
+        task.Asset("USD", "b", 10, 0.1),
+        task.Asset("EUR", "c", 20, 0.2),
+        task.Asset("USD", "a", 30, 0.3),
+    ])
+    assert not bank.add(task.Asset("RUB", "a", 1, 1))
+    assert 3 == len(bank) and "a" in bank
+    assert ["a", "b"] == sorted(asset.name for asset in bank.get_by_char_code("USD"))
+    assert ["c", "a"] == [asset.name for asset in bank.get(["c", "x", "a", "c"])]
+    assert ("EUR", "c") == tuple(bank.sorted_list()[0][:2])
+    assert ["a", "b"] == [row[1] for row in bank.sorted_list()[1:]]
+    bank.clear()
+    assert () == bank.sorted_list()
+
+
+@pytest.mark.parametrize("periods", [[1, 2, 10], [0, 3, 3], [-1, 500]])
+def test_composite_asset_calculate_revenues(periods):
+    assets = [
+        task.Asset("USD", "a", 1000, 0.05),
+        task.Asset("EUR", "b", 100, 0.01),
+        task.Asset("RUB", "c", 10, 0.2),
+    ]
+    rates_dict = {"USD": 75.0, "EUR": 90.0}
+    bank = task.CompositeAsset(assets)
+    revenues = bank.calculate_revenues(periods, rates_dict)
+    for period, revenue in zip(periods, revenues):
+        expected = sum(rates_dict.get(asset.char_code, 1) * asset.calculate_revenue(period)
+                       for asset in assets)
+        assert expected == pytest.approx(revenue)
+        assert revenue == pytest.approx(bank.calculate_revenue(period, rates_dict))
+
+
+def test_add_assets_in_bulk_from_json_lines(client):
+    client.get('/api/asset/cleanup')
+    client.get("/api/asset/add/RUB/First/1000/1.01")
+    body = "\n".join([
+        '{"char_code": "EUR", "name": "Second", "capital": 100, "interest": 1.02}',
+        '{"char_code": "USD", "name": "First", "capital": 10, "interest": 0.1}',
+        '{"char_code": "USD", "name": "Third"}',
+        '',
+        '{"char_code": "USD", "name": "Fourth", "capital": "abc", "interest": 0.1}',
+        '{"char_code": "USD", "name": "Second", "capital": 1, "interest": 0.1}',
+    ])
+    response = client.post('/api/asset/add_bulk', data=body,
+                           content_type="application/x-ndjson")
+    assert 200 == response.status_code
+    result = response.get_json()
+    assert 1 == result["added"]
+    assert [2, 3, 5, 6] == [error["row"] for error in result["errors"]]
+    assert [["EUR", "Second", 100.0, 1.02], ["RUB", "First", 1000.0, 1.01]] == \
+        client.get('/api/asset/list').get_json()
+
+
+def test_add_assets_in_bulk_from_csv(client):
+    client.get('/api/asset/cleanup')
+    body = "char_code,name,capital,interest\nRUB,First,1000,1.01\nEUR,Second,100,1.02\nUSD,Third\n"
+    response = client.post('/api/asset/add_bulk', data=body, content_type="text/csv")
+    assert {"added": 2, "errors": [{"row": 4, "error": "malformed row"}]} == response.get_json()
+    assert 415 == client.post('/api/asset/add_bulk', data=body,
+                              content_type="text/plain").status_code
+
+
+def test_add_assets_in_bulk_reports_invalid_rows(client):
+    client.get('/api/asset/cleanup')
+    body = b"\n".join([
+        b'{"char_code": "EUR", "name": ["a"], "capital": 100, "interest": 1.02}',
+        b'{"char_code": "EUR", "name": null, "capital": 100, "interest": 1.02}',
+        b'{"char_code": "EUR", "name": "\xff\xfe", "capital": 100, "interest": 1.02}',
+        b'{"char_code": "EUR", "name": "Good", "capital": 100, "interest": 1.02}',
+    ])
+    response = client.post('/api/asset/add_bulk', data=body,
+                           content_type="application/x-ndjson")
+    assert 200 == response.status_code
+    result = response.get_json()
+    assert 1 == result["added"]
+    assert [1, 2, 3] == [error["row"] for error in result["errors"]]
+    assert "row is not valid utf-8" == result["errors"][2]["error"]
+    assert [["EUR", "Good", 100.0, 1.02]] == client.get('/api/asset/list').get_json()
+    response = client.post('/api/asset/add_bulk', data=b"RUB,\xff,1,1\nRUB,,1,1\n",
+                           content_type="text/csv")
+    assert [1, 2] == [error["row"] for error in response.get_json()["errors"]]
+
+
+def test_add_assets_in_bulk_reports_lone_surrogates_with_storage(client, tmp_path, monkeypatch):
+    from asset_storage import SqliteAssetStorage
+    bank = task.CompositeAsset(storage=SqliteAssetStorage(str(tmp_path / "assets.sqlite")))
+    monkeypatch.setattr(task.app, "bank", bank)
+    body = "\n".join([
+        '{"char_code": "EUR", "name": "\\ud800", "capital": 100, "interest": 1.02}',
+        '{"char_code": "EUR", "name": "Good", "capital": 100, "interest": 1.02}',
+    ])
+    response = client.post('/api/asset/add_bulk', data=body,
+                           content_type="application/x-ndjson")
+    assert {"added": 1, "errors": [{"row": 1, "error": "row is not valid utf-8"}]} == \
+        response.get_json()
+    assert [["EUR", "Good", 100.0, 1.02]] == client.get('/api/asset/list').get_json()
+
+
+def test_add_assets_in_bulk_from_csv_with_quoted_newlines(client):
+    client.get('/api/asset/cleanup')
+    body = 'RUB,"Multi\r\nline",1000,1.01\r\nEUR,Second,100,1.02\r\n'
+    response = client.post('/api/asset/add_bulk', data=body, content_type="text/csv")
+    assert {"added": 2, "errors": []} == response.get_json()
+    names = [row[1] for row in client.get('/api/asset/list').get_json()]
+    assert ["Multi\r\nline", "Second"] == sorted(names)
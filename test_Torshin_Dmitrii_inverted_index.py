@@ -14,7 +14,7 @@ def test_process_queries(capsys):
         captured = capsys.readouterr()
         assert "load inverted index" not in captured.out
         assert "load inverted index" in captured.err
-        assert "1894,6343,586,2162,4149,4702" in captured.out
+        assert "586,1894,2162,4149,4702,6343" in captured.out
 
 
 def _test_callback_query():
@@ -56,4 +56,100 @@ def test_dump_load(inverted_index_):
 def test_query(inverted_index_, query, answer):
     ii = InvertedIndex()
     ii.inverted_index = inverted_index_
-    assert ii.query(query) == answer
\ No newline at end of file
+    assert ii.query(query) == answer
+
+
+@pytest.mark.parametrize(
+    "first,second",
+    [(range(0, 10), range(5, 15)),
+    (range(0, 20000, 2), range(0, 20000, 3)),
+    (range(0, 20000, 2), [4, 5, 6, 70000]),
+    (range(0, 4000, 1), [3, 5, 700, 3999, 4000]),
+    (range(0, 200000, 7), range(60000, 140000))],
+)
+def test_posting_list_operations(first, second):
+    first_list = PostingList.from_ids(first)
+    second_list = PostingList.from_ids(second)
+    assert sorted(set(first) & set(second)) == list(first_list.intersection(second_list))
+    assert sorted(set(first) | set(second)) == list(first_list.union(second_list))
+    assert len(set(first)) == len(first_list)
+
+
+def test_posting_list_uses_bitmaps_for_dense_containers():
+    posting_list = PostingList.from_ids(list(range(0, 10000)) + [70000])
+    assert isinstance(posting_list.containers[0], int)
+    assert [70000 & 0xFFFF] == list(posting_list.containers[1])
+
+
+def test_hybrid_dump_load(tmp_path):
+    inverted_index_ = {'a': list(range(0, 100000, 3)), 'b': [3, 69999], 'ы': [2]}
+    filepath = str(tmp_path / 'hybrid.index')
+    ii = InvertedIndex()
+    ii.inverted_index = inverted_index_
+    ii.dump(filepath, HybridStoragePolicy)
+    assert HybridStoragePolicy is detect_storage_policy(filepath)
+    ii = InvertedIndex.load(filepath, HybridStoragePolicy)
+    assert inverted_index_ == ii.inverted_index
+    assert [3, 69999] == sorted(ii.query('b a'))
+    assert [] == ii.query('a ы')
+    assert sorted(ii.query('a')) == inverted_index_['a']
+
+
+def test_document_store(tmp_path):
+    filepath = str(tmp_path / 'documents.store')
+    documents = [f'{index}\tdocument number {index} text\n' for index in range(1000, 0, -3)]
+    DocumentStore.dump(documents, filepath, block_size=16)
+    store = DocumentStore(filepath, cache_size=2)
+    assert 'document number 7 text' == store.get(7)
+    assert 'document number 1000 text' == store.get(1000)
+    assert None is store.get(8)
+    assert 2 == len(store._block_cache)
+    store.close()
+
+
+def test_make_snippet():
+    text = ' '.join(f'w{index}' for index in range(100))
+    assert '... w49 **w50** w51 ...' == make_snippet(text, ['w50', 'x'], width=3)
+    assert '**w0** w1 ...' == make_snippet(text, ['w0'], width=2)
+    assert 'a b' == make_snippet('a b', ['x'])
+
+
+def test_process_queries_with_snippets(tmp_path, capsys):
+    dataset = tmp_path / 'dataset.txt'
+    dataset.write_text('1\tred green\n2\tgreen blue sky\n3\tblue\n')
+    index_path = str(tmp_path / 'inverted.index')
+    documents_path = str(tmp_path / 'documents.store')
+    process_build(str(dataset), index_path, documents_path)
+    process_queries(index_path, ['green blue\n'], with_snippets=True,
+                    document_store_filepath=documents_path)
+    assert '2\n2\t**green** **blue** sky\n' == capsys.readouterr().out
+
+
+def test_chunked():
+    assert [(0, [0, 1]), (2, [2, 3]), (4, [4])] == list(chunked(range(5), 2))
+
+
+def test_process_queries_in_parallel(tmp_path, capsys):
+    dataset = tmp_path / 'dataset.txt'
+    dataset.write_text(''.join(f'{index}\tw{index % 7} w{index % 5} common\n'
+                               for index in range(1, 200)))
+    index_path = str(tmp_path / 'inverted.index')
+    documents_path = str(tmp_path / 'documents.store')
+    process_build(str(dataset), index_path, documents_path)
+    queries = [f'w{index % 7} w{index % 5}\n' for index in range(100)] + ['missing\n']
+    process_queries(index_path, queries, with_snippets=True,
+                    document_store_filepath=documents_path)
+    serial = capsys.readouterr().out
+    process_queries(index_path, queries, with_snippets=True,
+                    document_store_filepath=documents_path, workers=3, chunk_size=7)
+    assert serial == capsys.readouterr().out
+
+
+def test_process_queries_with_snippets_without_document_store(tmp_path):
+    dataset = tmp_path / 'dataset.txt'
+    dataset.write_text('1\tred green\n')
+    index_path = str(tmp_path / 'inverted.index')
+    process_build(str(dataset), index_path)
+    with pytest.raises(ArgumentTypeError, match="can't open document store"):
+        process_queries(index_path, ['green\n'], with_snippets=True,
+                        document_store_filepath=str(tmp_path / 'missing.store'))
@@ -93,3 +93,46 @@ def test_process_queries():
                 '{"start": 2009, "end": 2009, "top": []}',
             ]
             assert res == process_queries(fin, stop_words, TEST_QUERY)
+
+
+def test_process_queries_approximate(tmp_path):
+    """approximate answers are exact on small data"""
+    posts = [
+        '<row PostTypeId="1" CreationDate="2008-01-01" Score="5" Title="Python and files" />',
+        '<row PostTypeId="1" CreationDate="2009-01-01" Score="3" Title="Python is python" />',
+        '<row PostTypeId="2" CreationDate="2009-01-01" Score="9" Title="Answer" />',
+    ]
+    query_file = tmp_path / 'query.csv'
+    query_file.write_text('2008,2009,2\n2010,2011,2\n')
+    assert [
+        '{"start": 2008, "end": 2009, "top": [["python", 8], ["files", 5]]}',
+        '{"start": 2010, "end": 2011, "top": []}',
+    ] == process_queries(posts, ['and\n', 'is\n'], str(query_file), approximate = (10, 0.001, 0.01))
+
+
+def test_load_log_config_is_cached(tmp_path):
+    """config is parsed again only after it changes"""
+    config_path = tmp_path / 'log_config.yml'
+    config_path.write_text('version: 1\nloggers:\n  app:\n    level: DEBUG\n')
+    assert {'version': 1, 'loggers': {'app': {'level': 'DEBUG'}}} == load_log_config(str(config_path))
+    assert (tmp_path / LOG_CONFIG_CACHE_DIR / 'log_config.yml.json').exists()
+    assert load_log_config(str(config_path)) == load_log_config(str(config_path))
+    config_path.write_text('version: 1\nloggers:\n  app:\n    level: WARNING\n')
+    assert 'WARNING' == load_log_config(str(config_path))['loggers']['app']['level']
+
+
+def test_process_queries_approximate_matches_exact(tmp_path):
+    """words with zero or negative total score are left out in both modes"""
+    posts = [
+        '<row PostTypeId="1" CreationDate="2008-01-01" Score="4" Title="Good" />',
+        '<row PostTypeId="1" CreationDate="2008-02-01" Score="0" Title="Zero words" />',
+        '<row PostTypeId="1" CreationDate="2008-03-01" Score="-2" Title="Bad words" />',
+        '<row PostTypeId="1" CreationDate="2009-01-01" Score="2" Title="Fine news" />',
+        '<row PostTypeId="1" CreationDate="2010-01-01" Score="3" Title="The news" />',
+    ]
+    query_file = tmp_path / 'query.csv'
+    query_file.write_text('2008,2008,3\n2008,2009,5\n2009,2010,2\n2011,2012,1\n')
+    exact = process_queries(posts, ['the\n'], str(query_file))
+    assert '{"start": 2008, "end": 2008, "top": [["good", 4]]}' == exact[0]
+    assert exact == process_queries(posts, ['the\n'], str(query_file),
+                                    approximate = (10, 0.001, 0.01))
@@ -0,0 +1,49 @@
+import pytest
+
+from asset_storage import SqliteAssetStorage
+import task_Torshin_Dmitrii_asset_web_service as task
+
+
+@pytest.fixture
+def storage_path(tmp_path):
+    return str(tmp_path / "assets.sqlite")
+
+
+def test_add_many_skips_stored_names(storage_path):
+    storage = SqliteAssetStorage(storage_path)
+    assert ["a", "b"] == storage.add_many([("USD", "a", 1, 0.1), ("EUR", "b", 2, 0.2)])
+    assert ["c"] == storage.add_many([("RUB", "a", 3, 0.3), ("RUB", "c", 3, 0.3)])
+    generation, last_id, rows = storage.changes(None, 0)
+    assert 3 == last_id
+    assert [("USD", "a", 1, 0.1), ("EUR", "b", 2, 0.2), ("RUB", "c", 3, 0.3)] == rows
+    assert (generation, 3, []) == storage.changes(generation, last_id)
+
+
+def test_clear_changes_generation(storage_path):
+    storage = SqliteAssetStorage(storage_path)
+    storage.add_many([("USD", "a", 1, 0.1)])
+    generation, last_id, _ = storage.changes(None, 0)
+    storage.clear()
+    storage.add_many([("EUR", "b", 2, 0.2)])
+    new_generation, _, rows = storage.changes(generation, last_id)
+    assert generation != new_generation
+    assert [("EUR", "b", 2, 0.2)] == rows
+
+
+def test_banks_share_storage(storage_path):
+    first = task.CompositeAsset(storage=SqliteAssetStorage(storage_path))
+    second = task.CompositeAsset(storage=SqliteAssetStorage(storage_path))
+    assert first.add(task.Asset("USD", "a", 1, 0.1))
+    assert not second.add(task.Asset("EUR", "a", 2, 0.2))
+    assert second.add(task.Asset("EUR", "b", 2, 0.2))
+    assert [["EUR", "b", 2.0, 0.2], ["USD", "a", 1.0, 0.1]] == list(first.sorted_list())
+    second.clear()
+    assert 0 == len(first)
+
+
+def test_bank_is_restored_from_storage(storage_path):
+    bank = task.CompositeAsset(storage=SqliteAssetStorage(storage_path))
+    bank.add_many([task.Asset("USD", "a", 1, 0.1), task.Asset("EUR", "b", 2, 0.2)])
+    restored = task.CompositeAsset(storage=SqliteAssetStorage(storage_path))
+    assert list(bank.sorted_list()) == list(restored.sorted_list())
+    assert bank.calculate_revenue(1, {}) == pytest.approx(restored.calculate_revenue(1, {}))
@@ -0,0 +1,20 @@
+import pytest
+
+from bench_startup import CLI_MODULES, import_module_timed, imported_heavy_modules, parse_importtime
+
+
+def test_parse_importtime():
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   _io\n"
+        "import time:       300 |        420 | tool\n"
+        "some warning\n"
+    )
+    assert [("_io", 120, 120), ("tool", 300, 420)] == parse_importtime(output)
+
+
+@pytest.mark.parametrize("module", CLI_MODULES)
+def test_cli_startup_does_not_import_heavy_modules(module):
+    imports = import_module_timed(module)
+    assert module in [name for name, _, _ in imports]
+    assert [] == imported_heavy_modules(imports)
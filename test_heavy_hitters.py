@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+from heavy_hitters import CountMinSketch, HeavyHitters, RangeHeavyHitters
+
+
+def test_sketch_never_underestimates_non_negative_counts():
+    sketch = CountMinSketch.from_error(epsilon=0.01, delta=0.01)
+    rng = random.Random(0)
+    counts = {}
+    for _ in range(10000):
+        word = f"word{rng.randrange(2000)}"
+        counts[word] = counts.get(word, 0) + 1
+        sketch.add(word)
+    total = sum(counts.values())
+    for word, count in counts.items():
+        assert count <= sketch.estimate(word) <= count + 0.01 * total * 2
+
+
+def test_sketch_merge_equals_sketch_of_both_streams():
+    first, second, both = (CountMinSketch(64, 3) for _ in range(3))
+    for index in range(100):
+        (first if index % 2 else second).add(f"w{index % 7}", index)
+        both.add(f"w{index % 7}", index)
+    assert both.rows == first.merge(second).rows
+    with pytest.raises(ValueError):
+        first.merge(CountMinSketch(32, 3))
+
+
+def test_heavy_hitters_are_exact_on_small_streams():
+    heavy_hitters = HeavyHitters.from_error(capacity=10, epsilon=0.001, delta=0.01)
+    for word, score in [("b", 3), ("a", 3), ("c", 1), ("a", 2), ("d", 7)]:
+        heavy_hitters.add(word, score)
+    assert [("d", 7), ("a", 5), ("b", 3)] == heavy_hitters.top(3)
+
+
+def test_heavy_hitters_keep_top_words_in_bounded_capacity():
+    heavy_hitters = HeavyHitters.from_error(capacity=20, epsilon=0.001, delta=0.01)
+    rng = random.Random(1)
+    stream = [f"heavy{index}" for index in range(5) for _ in range(100)]
+    stream += [f"light{index}" for index in range(1000)]
+    rng.shuffle(stream)
+    for word in stream:
+        heavy_hitters.add(word, 1)
+    assert len(heavy_hitters.candidates) <= 20
+    assert [(f"heavy{index}", 100) for index in range(5)] == heavy_hitters.top(5)
+
+
+def test_heavy_hitters_merge():
+    first = HeavyHitters.from_error(capacity=3, epsilon=0.001, delta=0.01)
+    second = HeavyHitters.from_error(capacity=3, epsilon=0.001, delta=0.01)
+    for word, score in [("a", 5), ("b", 4), ("c", 1)]:
+        first.add(word, score)
+    for word, score in [("c", 10), ("d", 2)]:
+        second.add(word, score)
+    assert [("c", 11), ("a", 5), ("b", 4)] == first.merge(second).top(5)
+
+
+def test_range_heavy_hitters_match_merged_years():
+    rng = random.Random(2)
+    by_year = {}
+    for year in range(2008, 2014):
+        by_year[year] = HeavyHitters(50, CountMinSketch(256, 4))
+        for _ in range(300):
+            by_year[year].add(f"w{rng.randrange(40)}", rng.randrange(10))
+    ranges = RangeHeavyHitters(by_year)
+    for start, end in [(2008, 2013), (2010, 2011), (2000, 2009), (2013, 2020)]:
+        merged = by_year[max(start, 2008)]
+        for year in range(max(start, 2008) + 1, min(end, 2013) + 1):
+            merged = merged.merge(by_year[year])
+        assert merged.top(10) == ranges.top(start, end, 10)
+    assert [] == ranges.top(2014, 2020, 10)
+    assert ranges.top(2009, 2012, 3) == ranges.top(2009, 2012, 10)[:3]
+
+
+def test_range_heavy_hitters_cache_is_bounded():
+    by_year = {}
+    for year in range(2000, 2010):
+        by_year[year] = HeavyHitters(3, CountMinSketch(256, 4))
+        for index in range(10):
+            by_year[year].add(f"w{index}", index + 1)
+    ranges = RangeHeavyHitters(by_year, cache_size=4)
+    for start in range(2000, 2010):
+        assert 3 == len(ranges.top(start, 2009, 10))
+    assert 4 == len(ranges._ranked)
+    assert all(len(ranked) <= 3 for ranked in ranges._ranked.values())
+    ranges.top(2006, 2009, 1)
+    ranges.top(2000, 2000, 1)
+    assert (6, 10) in ranges._ranked
@@ -0,0 +1,21 @@
+import pytest
+
+from load_test import percentile, run_load_test
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert 50 == percentile(values, 0.5)
+    assert 99 == percentile(values, 0.99)
+    assert 100 == percentile(values, 1.0)
+    assert 1 == percentile(values, 0.0)
+    assert None is percentile([], 0.5)
+
+
+@pytest.mark.parametrize("app_name", ["hello_world", "wiki_search", "asset_service"])
+def test_run_load_test(app_name):
+    report = run_load_test(app_name, workers=2, concurrency=4, duration=0.3,
+                           upstream_latency=0.001, asset_count=10)
+    assert report["requests"] > 0
+    assert {"200": report["requests"]} == report["statuses"]
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
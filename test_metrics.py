@@ -0,0 +1,72 @@
+import os
+
+from flask import Flask, abort
+import pytest
+
+from metrics import Histogram, Metrics, instrument_app
+
+
+@pytest.fixture
+def instrumented():
+    app = Flask(__name__)
+    metrics = instrument_app(app)
+
+    @app.route('/hello/<name>')
+    def hello(name):
+        with metrics.timed("upstream", "fake"):
+            pass
+        return f"Hello, {name}"
+
+    @app.route('/fail')
+    def fail():
+        abort(503)
+
+    with app.test_client() as client:
+        yield client, metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "test", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value, "/a")
+    lines = list(histogram.collect())
+    assert 'latency_bucket{route="/a",le="0.1"} 2' in lines
+    assert 'latency_bucket{route="/a",le="1.0"} 3' in lines
+    assert 'latency_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'latency_count{route="/a"} 4' in lines
+    assert 'latency_sum{route="/a"} 5.65' in lines
+
+
+def test_metrics_endpoint_reports_routes(instrumented):
+    client, metrics = instrumented
+    client.get("/hello/a")
+    client.get("/hello/b")
+    client.get("/fail")
+    client.get("/missing")
+    response = client.get("/metrics")
+    assert 200 == response.status_code
+    text = response.get_data(as_text=True)
+    assert ('http_request_duration_seconds_count'
+            '{method="GET",route="/hello/<name>",status="200"} 2') in text
+    assert 'route="/fail",status="503"} 1' in text
+    assert 'route="<unmatched>",status="404"} 1' in text
+    assert 'stage_duration_seconds_count{stage="upstream",target="fake"} 2' in text
+    assert "http_requests_in_flight 1" in text
+    assert 0 == metrics.in_flight.value
+
+
+def test_metrics_are_summed_over_processes_sharing_dir(tmp_path):
+    metrics = Metrics(buckets=(1.0,), shared_dir=str(tmp_path))
+    metrics.request_duration.observe(0.5, "GET", "/a", 200)
+    pid = os.fork()
+    if pid == 0:
+        metrics.request_duration.observe(0.5, "GET", "/a", 200)
+        metrics.request_duration.observe(2.0, "GET", "/b", 500)
+        metrics.in_flight.add(1)
+        metrics.flush()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    text = metrics.render()
+    assert 'http_request_duration_seconds_count{method="GET",route="/a",status="200"} 2' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/b",status="500"} 1' in text
+    assert "http_requests_in_flight 0" in text
@@ -0,0 +1,66 @@
+import logging
+import os
+
+from queued_logging import RateLimitFilter, setup_queued_logging, stop_queued_logging
+
+
+def make_record(level):
+    return logging.LogRecord("test", level, __file__, 1, "message %s", (1,), None)
+
+
+def test_rate_limit_filter_drops_only_low_levels(clock):
+    rate_limit = RateLimitFilter(rate=2, burst=2, max_level="DEBUG", clock=clock)
+    assert [True, True, False] == [rate_limit.filter(make_record(logging.DEBUG)) for _ in range(3)]
+    assert rate_limit.filter(make_record(logging.WARNING))
+    clock.now = 0.5
+    assert rate_limit.filter(make_record(logging.DEBUG))
+    assert not rate_limit.filter(make_record(logging.DEBUG))
+    assert 2 == rate_limit.dropped
+
+
+def make_config(log_path, logger_name="queued_test"):
+    return {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "formatters": {"simple": {"format": "%(levelname)s %(message)s"}},
+        "handlers": {"file": {
+            "class": "logging.FileHandler", "filename": str(log_path),
+            "level": "INFO", "formatter": "simple",
+        }},
+        "loggers": {logger_name: {"level": "DEBUG", "handlers": ["file"]}},
+    }
+
+
+def test_setup_queued_logging_writes_records_in_background(tmp_path):
+    log_path = tmp_path / "queued.log"
+    setup_queued_logging(make_config(log_path))
+    logger = logging.getLogger("queued_test")
+    assert all(isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers)
+    logger.debug("skipped %s", "debug")
+    logger.info("written %s", [1, 2])
+    stop_queued_logging()
+    assert "INFO written [1, 2]\n" == log_path.read_text()
+
+
+def test_setup_queued_logging_keeps_listeners_of_other_loggers(tmp_path):
+    setup_queued_logging(make_config(tmp_path / "first.log", "queued_first"))
+    setup_queued_logging(make_config(tmp_path / "second.log", "queued_second"))
+    logging.getLogger("queued_first").info("first")
+    logging.getLogger("queued_second").info("second")
+    stop_queued_logging()
+    assert "INFO first\n" == (tmp_path / "first.log").read_text()
+    assert "INFO second\n" == (tmp_path / "second.log").read_text()
+
+
+def test_queued_logging_works_in_forked_child(tmp_path):
+    log_path = tmp_path / "queued.log"
+    setup_queued_logging(make_config(log_path))
+    pid = os.fork()
+    if pid == 0:
+        logging.getLogger("queued_test").info("child")
+        stop_queued_logging()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    logging.getLogger("queued_test").info("parent")
+    stop_queued_logging()
+    assert "INFO child\nINFO parent\n" == log_path.read_text()
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from response_cache import TTLCache
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.get_or_compute("a", lambda: 1)
+    cache.get_or_compute("b", lambda: 2)
+    assert 1 == cache.get_or_compute("a", lambda: -1)
+    cache.get_or_compute("c", lambda: 3)
+    assert 2 == len(cache)
+    assert -2 == cache.get_or_compute("b", lambda: -2)
+    assert (1, 4) == (cache.hits, cache.misses)
+
+
+def test_cache_entries_expire(clock):
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.get_or_compute("a", lambda: 1)
+    clock.now = 9
+    assert 1 == cache.get_or_compute("a", lambda: 2)
+    clock.now = 11
+    assert 2 == cache.get_or_compute("a", lambda: 2)
+
+
+def test_cache_skips_uncacheable_values_and_errors():
+    cache = TTLCache()
+    assert None is cache.get_or_compute("a", lambda: None, cacheable=lambda v: v is not None)
+    with pytest.raises(ZeroDivisionError):
+        cache.get_or_compute("a", lambda: 1 / 0)
+    assert 0 == len(cache)
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("a", compute)))
+               for _ in range(8)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert 1 == len(calls)
+    assert ["value"] * 8 == results
+
+
+def test_cache_is_bounded_by_total_weight():
+    cache = TTLCache(maxsize=10, max_weight=10, weigh=len)
+    cache.get_or_compute("a", lambda: "aaaa")
+    cache.get_or_compute("b", lambda: "bbbb")
+    cache.get_or_compute("c", lambda: "cccc")
+    assert 2 == len(cache) and 8 == cache.weight
+    assert "new" == cache.get_or_compute("a", lambda: "new")
+    assert 2 == len(cache) and 7 == cache.weight
+    cache.get_or_compute("huge", lambda: "x" * 11)
+    assert 2 == len(cache) and 7 == cache.weight
+    cache.clear()
+    assert 0 == cache.weight
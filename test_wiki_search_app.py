@@ -1,5 +1,9 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
 import pytest
 from flask import request
+import wiki_search_app
 from wiki_search_app import app, parse_wiki_search_output
 
 FIRST_PYTHON_DOCUMENT = [
@@ -39,4 +43,114 @@ def test_can_parse_wiki_search_output():
     documents = parse_wiki_search_output(wiki_search_output_html)
     assert 20 == len(documents)
 
-    assert FIRST_PYTHON_DOCUMENT == documents[0]
\ No newline at end of file
+    assert FIRST_PYTHON_DOCUMENT == documents[0]
+
+
+class FakeWikiResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+
+def test_wiki_responses_are_cached(client, monkeypatch):
+    calls = []
+    page = ("<html><body><ul><li class='mw-search-result'><a title='Python' href='/wiki/Python'>"
+            "Python</a><div class='searchresult'>snake</div></li></ul></body></html>")
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        return FakeWikiResponse(page)
+
+    monkeypatch.setattr(wiki_search_app.WIKI_SESSION, "get", fake_get)
+    wiki_search_app.WIKI_RESPONSE_CACHE.clear()
+    wiki_search_app.WIKI_DOCUMENTS_CACHE.clear()
+    for query in ["python  snake", " python snake"]:
+        app_response = client.get("/api/search", query_string={"query": query})
+        assert [["Python", "/wiki/Python", "snake"]] == app_response.get_json()["documents"]
+    assert page == client.get("/search?query=python snake").get_data(as_text=True)
+    assert 1 == len(calls)
+
+
+def test_wiki_errors_are_not_cached(client, monkeypatch):
+    calls = []
+
+    def fake_get(url, **kwargs):
+        calls.append(url)
+        return FakeWikiResponse("unavailable", 503)
+
+    monkeypatch.setattr(wiki_search_app.WIKI_SESSION, "get", fake_get)
+    wiki_search_app.WIKI_RESPONSE_CACHE.clear()
+    wiki_search_app.WIKI_DOCUMENTS_CACHE.clear()
+    assert 503 == client.get("/api/search?query=python").status_code
+    assert 503 == client.get("/search?query=python").status_code
+    assert 2 == len(calls)
+
+
+class StubWikiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = f"<html><body>{self.path}</body></html>".encode("utf-8") * 1000
+        self.send_response(200 if "missing" not in self.path else 404)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_wiki(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikiHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(wiki_search_app, "WIKI_BASE_SEARCH_URL",
+                        f"http://127.0.0.1:{server.server_port}/w/index.php?search=")
+    monkeypatch.setitem(app.config, "WIKI_PROXY_STREAMING", True)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_can_stream_proxy_request(client, stub_wiki, monkeypatch):
+    closed = []
+    original_get = wiki_search_app.WIKI_SESSION.get
+
+    def recording_get(*args, **kwargs):
+        wiki_response = original_get(*args, **kwargs)
+        close = wiki_response.close
+        wiki_response.close = lambda: (closed.append(wiki_response.url), close())
+        return wiki_response
+
+    monkeypatch.setattr(wiki_search_app.WIKI_SESSION, "get", recording_get)
+    app_response = client.get("/search?query=python", buffered=False)
+    assert 200 == app_response.status_code
+    assert app_response.is_streamed
+    assert "text/html; charset=utf-8" == app_response.content_type
+    expected = "<html><body>/w/index.php?search=python</body></html>" * 1000
+    assert expected == app_response.get_data(as_text=True)
+    app_response.close()
+    missing_response = client.get("/search?query=missing")
+    assert 404 == missing_response.status_code
+    missing_response.close()
+    head_response = client.head("/search?query=head", buffered=False)
+    assert 200 == head_response.status_code
+    head_response.close()
+    assert 3 == len(closed)
+    assert closed[-1].endswith("search=head")
+
+
+def test_parse_wiki_search_output_ignores_rest_of_page():
+    results = "".join(
+        f"<li class='mw-search-result'><div><a href='/wiki/{i}' title='Doc {i}'>Doc</a>"
+        f"<a href='/other' title='Other'>x</a></div>"
+        f"<div class='searchresult'>text <span>{i}</span><!-- comment --> end</div></li>"
+        for i in range(50)
+    )
+    page = ("<html><head><title>search</title></head><body><ul><li>menu</li></ul>"
+            f"<ul class='mw-search-results'>{results}</ul>"
+            + "<p>footer</p>" * 5000 + "</body></html>")
+    documents = parse_wiki_search_output(page)
+    assert 50 == len(documents)
+    assert ["Doc 7", "/wiki/7", "text 7 end"] == documents[7]
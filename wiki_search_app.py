@@ -1,11 +1,16 @@
-import logging.config
+import os
 import yaml
 
-from flask import Flask, request, abort, jsonify, render_template
+from flask import Flask, Response, request, abort, jsonify, render_template
 from lxml import etree
 import requests
+from requests.adapters import HTTPAdapter
 
-logging.config.dictConfig(yaml.safe_load("""
+from metrics import instrument_app
+from queued_logging import setup_queued_logging
+from response_cache import TTLCache
+
+setup_queued_logging(yaml.safe_load("""
 version: 1
 formatters:
     simple:
@@ -40,24 +45,96 @@ root:
 """))
 
 app = Flask(__name__)
+metrics = instrument_app(app)
 WIKI_BASE_URL = "https://en.wikipedia.org/"
 WIKI_BASE_SEARCH_URL = f"{WIKI_BASE_URL}/w/index.php?search="
+WIKI_CACHE_SIZE = 1024
+WIKI_CACHE_TTL = 300
+# raw search pages are kept up to WIKI_RESPONSE_CACHE_BYTES characters per
+# worker whatever their size; parsed documents of a query are 20 short
+# snippets, a few KB, so the documents cache stays under ~10 MB
+WIKI_RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+WIKI_RESPONSE_CACHE = TTLCache(maxsize=WIKI_CACHE_SIZE, ttl=WIKI_CACHE_TTL,
+                               max_weight=WIKI_RESPONSE_CACHE_BYTES,
+                               weigh=lambda response: len(response[0]))
+WIKI_DOCUMENTS_CACHE = TTLCache(maxsize=WIKI_CACHE_SIZE, ttl=WIKI_CACHE_TTL)
+WIKI_POOL_SIZE = 128
+WIKI_STREAM_CHUNK_SIZE = 64 * 1024
+WIKI_PARSER_CHUNK_SIZE = 8 * 1024
+
+SEARCH_RESULTS = etree.XPath("//li[@class='mw-search-result']")
+SEARCH_RESULT_CHILDREN = etree.XPath("li[@class='mw-search-result']")
+DOCUMENT_TITLE = etree.XPath(".//a[1]/@title")
+DOCUMENT_LINK = etree.XPath(".//a[1]/@href")
+DOCUMENT_SNIPPET = etree.XPath("string((.//div[@class='searchresult'])[1])")
+
+# connections to wikipedia are kept alive and shared by all request threads
+WIKI_SESSION = requests.Session()
+WIKI_SESSION.mount("https://", HTTPAdapter(pool_maxsize=WIKI_POOL_SIZE))
+WIKI_SESSION.mount("http://", HTTPAdapter(pool_maxsize=WIKI_POOL_SIZE))
+
+# /search streams wikipedia pages through instead of caching them
+app.config["WIKI_PROXY_STREAMING"] = os.environ.get("WIKI_PROXY_STREAMING", "") == "1"
+
+
+def normalize_query(user_query):
+    """queries which differ only in whitespaces share cache entries"""
+    return " ".join(user_query.split())
+
+
+def fetch_wiki_search(user_query):
+    """get (html, status code) of wikipedia search page, ok pages are cached"""
+    def fetch():
+        with metrics.timed("upstream", "wikipedia"):
+            wiki_response = WIKI_SESSION.get(WIKI_BASE_SEARCH_URL + user_query)
+        return wiki_response.text, wiki_response.status_code, wiki_response.ok
+    text, status_code, _ = WIKI_RESPONSE_CACHE.get_or_compute(
+        user_query, fetch, cacheable=lambda response: response[2])
+    return text, status_code
+
+
+def search_wiki_documents(user_query):
+    """get parsed documents found by wikipedia, None if it is unavailable"""
+    def search():
+        text, status_code = fetch_wiki_search(user_query)
+        if status_code >= 400:
+            return None
+        with metrics.timed("parse", "wikipedia"):
+            return parse_wiki_search_output(text)
+    return WIKI_DOCUMENTS_CACHE.get_or_compute(
+        user_query, search, cacheable=lambda documents: documents is not None)
+
+
+def stream_wiki_search(user_query):
+    """proxy wikipedia search page chunk by chunk without buffering it"""
+    with metrics.timed("upstream", "wikipedia"):
+        wiki_response = WIKI_SESSION.get(WIKI_BASE_SEARCH_URL + user_query, stream=True)
+
+    response = Response(
+        wiki_response.iter_content(chunk_size=WIKI_STREAM_CHUNK_SIZE),
+        status = wiki_response.status_code,
+        content_type = wiki_response.headers.get("Content-Type"),
+    )
+    # body is not read at all for HEAD requests and early disconnects,
+    # connection goes back to the pool when the server closes the response
+    response.call_on_close(wiki_response.close)
+    return response
 
 
 @app.route('/search')
 def wiki_proxy_search():
-    user_query = request.args.get("query", "")
-    wiki_response = requests.get(WIKI_BASE_SEARCH_URL + user_query)
-    return wiki_response.text, wiki_response.status_code
+    user_query = normalize_query(request.args.get("query", ""))
+    if app.config["WIKI_PROXY_STREAMING"]:
+        return stream_wiki_search(user_query)
+    return fetch_wiki_search(user_query)
 
 
 @app.route('/pretty_search')
 def wiki_pretty_search():
-    user_query = request.args.get("query", "")
-    wiki_response = requests.get(WIKI_BASE_SEARCH_URL + user_query)
-    if not wiki_response.ok:
+    user_query = normalize_query(request.args.get("query", ""))
+    documents = search_wiki_documents(user_query)
+    if documents is None:
         abort(503)
-    documents = parse_wiki_search_output(wiki_response.text)
     return render_template(
         "wiki_search_result.html",
         query = user_query,
@@ -68,28 +145,33 @@ def wiki_pretty_search():
 
 @app.route('/api/search')
 def api_wiki_proxy_search():
-    user_query = request.args.get("query", "")
-    wiki_response = requests.get(WIKI_BASE_SEARCH_URL + user_query)
+    user_query = normalize_query(request.args.get("query", ""))
+    documents = search_wiki_documents(user_query)
     app.logger.debug("got query: %s", user_query)
-    if not wiki_response.ok:
+    if documents is None:
         abort(503)
-    documents = parse_wiki_search_output(wiki_response.text)
     app.logger.debug("found: %s documents for query: %s", len(documents), user_query)
-    return jsonify({
-        "documents": documents,
-        "version": 1.0,
-    })
+    with metrics.timed("serialize", "json"):
+        return jsonify({
+            "documents": documents,
+            "version": 1.0,
+        })
 
 
 def parse_wiki_search_output(wiki_search_output):
-    # x = sum(i**2 for i in range(10_000_000))
-    root = etree.fromstring(wiki_search_output, etree.HTMLParser())
-    documents = root.xpath("//li[@class='mw-search-result']")
+    # page is fed in chunks until the list with search results is closed,
+    # the rest of the page is not parsed at all
+    parser = etree.HTMLPullParser(events=("end",), tag="ul")
+    for start in range(0, len(wiki_search_output), WIKI_PARSER_CHUNK_SIZE):
+        parser.feed(wiki_search_output[start:start + WIKI_PARSER_CHUNK_SIZE])
+        if any(SEARCH_RESULT_CHILDREN(element) for _, element in parser.read_events()):
+            break
+    root = parser.close()
 
     document_collection = []
-    for document in documents:
-        title = document.xpath(".//a[1]/@title")[0]
-        link = document.xpath(".//a[1]/@href")[0]
-        snippet = "".join(document.xpath(".//div[@class='searchresult']")[0].itertext())
+    for document in SEARCH_RESULTS(root):
+        title = DOCUMENT_TITLE(document)[0]
+        link = DOCUMENT_LINK(document)[0]
+        snippet = DOCUMENT_SNIPPET(document)
         document_collection.append([title, link, snippet])
-    return document_collection
\ No newline at end of file
+    return document_collection